@@ -0,0 +1,271 @@
+# --- Rerun 延遲基準測試 ---
+# 以 streamlit.testing.v1.AppTest 無頭執行 cm_app.py，模擬實際操作流程：
+# 切換案件類型、填寫側邊欄、逐一勾選所有 chk_*、輸入備註、產生 Excel。
+# 每個互動記錄耗時、輸出元素數與記憶體峰值，結果附加寫入 JSONL，可跨版本比較。
+#
+#   python benchmarks/bench_rerun.py                       # 實際模板 + 放大模板
+#   python benchmarks/bench_rerun.py --sizes 0 50 --repeat 5
+#   python benchmarks/bench_rerun.py --no-memory           # 不追蹤記憶體 (tracemalloc 會讓每次 rerun 慢數倍)
+#   python benchmarks/bench_rerun.py --compare <git rev>   # 與舊版結果比較
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+APP_PATH = os.path.join(ROOT, "cm_app.py")
+DEFAULT_OUTPUT = os.path.join(ROOT, "benchmarks", "results.jsonl")
+REGRESSION_THRESHOLD = 1.2  # 中位數變慢 20% 以上視為退化
+
+SIDEBAR_VALUES = {
+    "kp_budget": 800, "kp_base_area": 1200, "kp_duration": 18, "kp_total_area": 15000,
+    "kp_height": 60.0, "kp_floors_above": 18, "kp_excavation": 13.0, "kp_floors_below": 4, "kp_span_rc": 9.0,
+}
+
+
+# --- 1. 放大模板 ---
+_original_build = None
+
+
+def enlarge_template(extra_items):
+    # 在每個階段附加 extra_items 個合成項目 (AppTest 與本程式同一個 process，直接替換引擎函式)
+    global _original_build
+    import sop_engine
+
+    if _original_build is None:
+        _original_build = sop_engine._build_sop_stages
+
+    def build(sig):
+        stages = _original_build(sig)
+        for stage, items in stages.items():
+            items.extend(
+                {"item": f"合成項目 {stage}-{i}", "dept": "測試", "method": "線上", "timing": "【開工前】",
+                 "docs": "合成文件", "critical": "", "details": "基準測試用"}
+                for i in range(extra_items)
+            )
+        return stages
+
+    sop_engine._build_sop_stages = build if extra_items else _original_build
+    sop_engine.compile_sop.cache_clear()
+
+
+# --- 2. 量測 ---
+def count_elements(node):
+    children = getattr(node, "children", None)
+    if not children:
+        return 1
+    return 1 + sum(count_elements(child) for child in children.values())
+
+
+def _reset_peak():
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+
+
+def _peak_kb():
+    return round(tracemalloc.get_traced_memory()[1] / 1024, 1) if tracemalloc.is_tracing() else None
+
+
+class Session:
+    def __init__(self, timeout, project_id):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.at.query_params["project"] = str(project_id)
+        self.records = []
+
+    def step(self, name, action=None):
+        _reset_peak()
+        start = time.perf_counter()
+        if action:
+            action(self.at)
+        self.at.run()
+        wall = time.perf_counter() - start
+        if self.at.exception:
+            raise RuntimeError(f"{name}: {self.at.exception[0].message}")
+        self.records.append({
+            "interaction": name,
+            "wall_ms": round(wall * 1000, 3),
+            "elements": count_elements(self.at._tree),
+            "peak_kb": _peak_kb(),
+        })
+
+    def measure(self, name, func):
+        _reset_peak()
+        start = time.perf_counter()
+        func()
+        self.records.append({
+            "interaction": name,
+            "wall_ms": round((time.perf_counter() - start) * 1000, 3),
+            "elements": 0,
+            "peak_kb": _peak_kb(),
+        })
+
+
+def _enabled_unchecked(at):
+    return [c.key for c in at.checkbox if c.key and c.key.startswith("chk_") and not c.disabled and not c.value]
+
+
+def run_session(timeout, project_id):
+    import sop_engine
+    import sop_export
+
+    s = Session(timeout, project_id)
+    s.step("initial_load")
+    s.step("switch_project_type", lambda at: at.radio(key="kp_project_type").set_value(sop_engine.PROJECT_TYPES[1]))
+    for key, value in SIDEBAR_VALUES.items():
+        s.step("sidebar_input", lambda at, k=key, v=value: at.number_input(key=k).set_value(v))
+
+    # 逐一勾選：每次勾選後可能解鎖新階段，直到沒有可勾選項目
+    while True:
+        pending = _enabled_unchecked(s.at)
+        if not pending:
+            break
+        s.step("tick_checkbox", lambda at, k=pending[0]: at.checkbox(key=k).check())
+
+    for note in [t.key for t in s.at.text_input if t.key and t.key.startswith("note_")]:
+        s.step("type_note", lambda at, k=note: at.text_input(key=k).input("已送件，待回覆"))
+
+    # 下載按鈕的資料為延遲產生的 callable，這裡以相同的快照直接呼叫匯出
+    state = s.at.session_state
+    params = sop_engine.params_from_state(state)
+    sop, rules = sop_engine.get_sop(params), sop_engine.evaluate_rules(params)
+    progress = {
+        stage: [(bool(state[item["chk_key"]]), state[item["note_key"]] if item["note_key"] in state else "")
+                for item in items]
+        for stage, items in sop.items()
+    }
+    sop_export.clear_cache()
+    s.measure("excel_export_cold", lambda: sop_export.workbook_bytes(sop, progress, rules))
+    s.measure("excel_export_cached", lambda: sop_export.workbook_bytes(sop, progress, rules))
+    return s.records
+
+
+# --- 3. 結果 ---
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def summarize(records):
+    grouped = defaultdict(list)
+    for r in records:
+        grouped[(r["template_extra_items"], r["interaction"])].append(r)
+    rows = []
+    for (size, name), rs in sorted(grouped.items()):
+        walls = sorted(r["wall_ms"] for r in rs)
+        rows.append({
+            "template_extra_items": size,
+            "interaction": name,
+            "count": len(rs),
+            "median_ms": round(statistics.median(walls), 2),
+            "p95_ms": round(walls[min(len(walls) - 1, int(len(walls) * 0.95))], 2),
+            "max_elements": max(r["elements"] for r in rs),
+            "max_peak_kb": max((r["peak_kb"] for r in rs if r["peak_kb"] is not None), default=None),
+        })
+    return rows
+
+
+def print_table(rows, extra_columns=()):
+    columns = ["template_extra_items", "interaction", "count", "median_ms", "p95_ms", "max_elements", "max_peak_kb", *extra_columns]
+    print("\t".join(columns))
+    for row in rows:
+        print("\t".join(str(row.get(c, "")) for c in columns))
+
+
+def load_results(path, revision):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [r for r in map(json.loads, f) if r["git_rev"].startswith(revision)]
+
+
+def compare(current, baseline):
+    base = {(r["template_extra_items"], r["interaction"]): r for r in summarize(baseline)}
+    rows, regressions = [], 0
+    for row in summarize(current):
+        old = base.get((row["template_extra_items"], row["interaction"]))
+        if old and old["median_ms"]:
+            ratio = row["median_ms"] / old["median_ms"]
+            row["baseline_median_ms"] = old["median_ms"]
+            row["ratio"] = round(ratio, 2)
+            if ratio > REGRESSION_THRESHOLD:
+                row["ratio"] = f"{row['ratio']} ⚠️"
+                regressions += 1
+        rows.append(row)
+    print_table(rows, ("baseline_median_ms", "ratio"))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="cm_app.py rerun 延遲基準測試 (AppTest)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 20], help="每階段附加的合成項目數")
+    parser.add_argument("--repeat", type=int, default=2, help="每種模板重複的 session 數")
+    parser.add_argument("--no-memory", action="store_true", help="不記錄記憶體峰值")
+    parser.add_argument("--timeout", type=float, default=60, help="單次 rerun 逾時秒數")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="結果 JSONL (附加寫入)")
+    parser.add_argument("--compare", metavar="REV", help="與此 git revision 的已存結果比較")
+    args = parser.parse_args(argv)
+
+    # 基準測試使用獨立的暫存資料庫，須在匯入 sop_store 之前設定
+    os.environ["CMAPP_DB"] = os.path.join(tempfile.mkdtemp(prefix="cmapp_bench_"), "bench.db")
+    import streamlit
+    import sop_engine
+    import sop_store
+
+    store = sop_store.ProjectStore()
+    revision = git_revision()
+    meta = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_rev": revision,
+        "python": platform.python_version(),
+        "streamlit": streamlit.__version__,
+    }
+
+    records = []
+    if not args.no_memory:
+        tracemalloc.start()
+    for size in args.sizes:
+        enlarge_template(size)
+        for run in range(args.repeat):
+            # 每個 session 使用全新的專案，避免上一輪的勾選影響流程
+            project_id = store.create_project(
+                f"bench-{size}-{run}-{time.time_ns()}", template_version=sop_engine.TEMPLATE_VERSION
+            )
+            for record in run_session(args.timeout, project_id):
+                records.append({**meta, "template_extra_items": size, "run": run, **record})
+    if not args.no_memory:
+        tracemalloc.stop()
+    enlarge_template(0)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    if args.compare:
+        baseline = load_results(args.output, args.compare)
+        if not baseline:
+            print(f"找不到 {args.compare} 的結果，只列出本次數據")
+        else:
+            return 1 if compare(records, baseline) else 0
+    print_table(summarize(records))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,31 @@
 import streamlit as st
-import pandas as pd
-import io
-import hashlib
+import functools
+import html
+import itertools
 from datetime import date
 
+import sop_blobs
+import sop_engine
+import sop_export
+import sop_import
+import sop_metrics
+import sop_progress
+import sop_schedule
+import sop_store
+
 # --- 1. 頁面設定 ---
 st.set_page_config(
-    page_title="建案行政SOP系統 (V20.0 結構重構版)",
+    page_title=f"建案行政SOP系統 (V{sop_engine.TEMPLATE_VERSION:.1f} 結構重構版)",
     page_icon="🏗️",
     layout="wide"
 )
+# 效能量測：各區段計時，網址加上 ?debug=1 顯示分解與百分位數
+run_timer = sop_metrics.RunTimer("main")
 
 # --- 2. 🛡️ 版本控制 (V20.0) ---
-CURRENT_VERSION = 20.0
+# 版本號唯一來源為 sop_engine.TEMPLATE_VERSION：模板項目改名 / 搬移階段時在該處遞增並登記 ITEM_RENAMES。
+# 版本更新時重建 session；專案資料在資料庫，首次載入時依模板版本遷移 (sop_engine.ensure_migrated)
+CURRENT_VERSION = float(sop_engine.TEMPLATE_VERSION)
 
 if "data_version" not in st.session_state:
     st.session_state.clear()
@@ -33,6 +46,8 @@ st.markdown("""
     .tag-online { background-color: #e3f2fd; color: #0d47a1; padding: 1px 6px; border-radius: 4px; font-size: 0.8em; font-weight: bold; border: 1px solid #90caf9; }
     .tag-paper { background-color: #efebe9; color: #5d4037; padding: 1px 6px; border-radius: 4px; font-size: 0.8em; font-weight: bold; border: 1px solid #bcaaa4; }
     .tag-demo { background-color: #ffcdd2; color: #b71c1c; padding: 1px 6px; border-radius: 4px; font-size: 0.8em; font-weight: bold; border: 1px solid #ef9a9a; }
+    .tag-due { background-color: #fff8e1; color: #8d6e63; padding: 1px 6px; border-radius: 4px; font-size: 0.8em; border: 1px solid #ffe082; }
+    .tag-overdue { background-color: #ffebee; color: #c62828; padding: 1px 6px; border-radius: 4px; font-size: 0.8em; font-weight: bold; border: 1px solid #ef9a9a; }
     .tag-struct { background-color: #e1bee7; color: #4a148c; padding: 1px 6px; border-radius: 4px; font-size: 0.8em; font-weight: bold; border: 1px solid #ce93d8; }
     .critical-info {
         color: #d32f2f; font-size: 0.9em; font-weight: bold; margin-left: 25px; margin-bottom: 5px;
@@ -50,224 +65,379 @@ st.title(f"🏗️ 建案行政SOP系統 (Ver {CURRENT_VERSION})")
 st.caption("修復：素地案誤顯示拆除項目、無法解鎖問題")
 
 # --- 3. 輔助函數 ---
-def generate_key(stage, item_name):
-    # 產生穩定唯一的 Key
-    return hashlib.md5(f"{stage}_{item_name}".encode()).hexdigest()[:10]
+@st.cache_resource(show_spinner=False)
+def get_store():
+    return sop_store.ProjectStore()
+
+def persist_field(key):
+    # widget on_change：只寫入變動的單一欄位，勾選同時增量更新解鎖計數
+    value = st.session_state[key]
+    try:
+        with run_timer.span("persist"):
+            version = get_store().set_value(
+                st.session_state.active_project, key, value, expected_version=st.session_state._state_version,
+                own_version=st.session_state._own_versions.get(key),
+            )
+    except sop_store.VersionConflict as conflict:
+        # 其他使用者已先改了這個欄位：以資料庫的值為準
+        value = st.session_state[key] = conflict.value
+        st.toast("此欄位已被其他使用者更新，已改為最新內容", icon="⚠️")
+    except sop_store.ProjectNotFound:
+        # 專案已被其他 session 刪除：接著的重跑會切換到其他專案
+        cached_project_names.clear()
+        st.toast("此專案已被刪除，變更未儲存", icon="⚠️")
+        return
+    else:
+        st.session_state._own_versions[key] = version  # 之後他人的寫入才算衝突
+        if version == st.session_state._state_version + 1:
+            st.session_state._state_version = version  # 中間沒有其他人的寫入
+    if key.startswith("chk_") and "_tracker" in st.session_state:
+        with run_timer.span("unlock_update"):
+            st.session_state._tracker.set(key, bool(value))
+
+PROJECT_PICKER_LIMIT = 50
+
+@st.cache_resource(ttl=60, show_spinner=False)
+def cached_project_names():
+    # {id: 名稱}，依最後修改排序；process 內所有 session 共用，建立 / 刪除 / 匯入專案時清除
+    return dict(get_store().list_projects())
+
+def project_options(project_names, active):
+    # 選單只送出最近修改 (或符合搜尋) 的 PROJECT_PICKER_LIMIT 個專案，目前專案一定在內
+    query = st.session_state.get("project_query", "").strip().casefold()
+    ids = (pid for pid, name in project_names.items() if query in name.casefold()) if query else iter(project_names)
+    options = list(itertools.islice(ids, PROJECT_PICKER_LIMIT))
+    if active not in options:
+        options.insert(0, active)
+    return options
+
+@st.cache_resource(show_spinner=False)
+def get_blob_store():
+    return sop_blobs.BlobStore()
+
+def save_attachment(item_key, widget_key):
+    # 上傳檔分塊雜湊寫入 blob store (相同內容只存一份)，再記錄到此專案的項目下
+    upload = st.session_state.get(widget_key)
+    if upload is None:
+        return
+    upload.seek(0)
+    with get_blob_store().lock:
+        blob, size = get_blob_store().put(upload, upload.name)
+        try:
+            get_store().add_attachment(st.session_state.active_project, item_key, upload.name, blob, size)
+        except sop_store.ProjectNotFound:
+            cached_project_names.clear()
+            st.toast("此專案已被刪除，附件未儲存", icon="⚠️")
+            return  # 檔案若無其他參照，由 sop_blobs CLI 清除
+    st.session_state._upload_nonce = st.session_state.get("_upload_nonce", 0) + 1  # 換 key 清空上傳元件
+    refresh_attachments()
+
+def delete_attachment(attachment_id):
+    with get_blob_store().lock:
+        blob, still_used = get_store().delete_attachment(attachment_id)
+        if blob and not still_used:
+            get_blob_store().remove(blob)
+    refresh_attachments()
+
+def refresh_attachments():
+    # 整個專案的附件一次查詢；整頁重跑與上傳 / 刪除後更新，片段重跑沿用
+    st.session_state._attachments = get_store().project_attachments(st.session_state.active_project)
+
+def render_attachments(item_key):
+    files = st.session_state._attachments.get(item_key, [])
+    popover = st.popover(f"📎 附件 ({len(files)})" if files else "📎 附件", key=f"attach_{item_key}", on_change="rerun")
+    with popover:
+        if not popover.open:
+            return  # 未開啟時不建立清單與上傳元件
+        for attachment_id, filename, blob, size in files:
+            c1, c2 = st.columns([5, 1])
+            url = get_blob_store().url(blob)
+            with c1:
+                if url:
+                    # 由 Streamlit 靜態檔服務串流，不經過此 session 的記憶體
+                    st.markdown(
+                        f'<a href="{url}" download="{html.escape(filename)}">📄 {html.escape(filename)}</a> '
+                        f"<span style='color:#666; font-size:0.9em'>({size / 1048576:.1f} MB)</span>",
+                        unsafe_allow_html=True,
+                    )
+                else:
+                    st.download_button(f"📄 {filename}", functools.partial(get_blob_store().read, blob), filename, key=f"dl_{attachment_id}")
+            c2.button("🗑️", key=f"del_{attachment_id}", on_click=delete_attachment, args=(attachment_id,))
+        widget_key = f"upload_{item_key}_{st.session_state.get('_upload_nonce', 0)}"
+        st.file_uploader("上傳掃描檔 / 照片", key=widget_key, on_change=save_attachment, args=(item_key, widget_key))
+
+def restore_dates(values):
+    # 資料庫中的里程碑為 ISO 字串，date_input 需要 date
+    return {
+        k: sop_schedule.parse_date(v) if k.startswith(sop_schedule.MILESTONE_PREFIX) else v
+        for k, v in values.items()
+    }
+
+def load_project(project_id):
+    # 切換專案：清掉上一個專案的欄位，再從資料庫載入
+    for key in [k for k in st.session_state.keys() if sop_store.is_persisted_key(k)]:
+        del st.session_state[key]
+    sop_engine.ensure_migrated(get_store(), project_id)
+    # 先取版本再讀狀態：期間若有其他寫入，下次 changes_since 會再帶回 (重複套用無妨)
+    st.session_state._state_version = get_store().project_version(project_id)
+    st.session_state._own_versions = {}
+    st.session_state.update(restore_dates(get_store().load_state(project_id)))
+    st.session_state._loaded_project = project_id
+
+def delete_project():
+    # 專案刪除後，不再被任何專案參照的附件檔一併移除
+    with get_blob_store().lock:
+        for blob in get_store().delete_project(st.session_state.active_project):
+            get_blob_store().remove(blob)
+    cached_project_names.clear()
+    del st.session_state.active_project
+    st.session_state.confirm_delete_project = False
+
+def create_project():
+    name = st.session_state.get("new_project_name", "").strip()
+    if not name:
+        return
+    try:
+        st.session_state.active_project = get_store().create_project(name, template_version=sop_engine.TEMPLATE_VERSION)
+        cached_project_names.clear()
+        st.session_state.new_project_name = ""
+        st.session_state.pop("_project_error", None)
+    except sop_store.DuplicateProjectName as exc:
+        st.session_state._project_error = str(exc)
+
+def timed_fragment(prefix, arg_index=0):
+    # 片段計時：span 名稱帶上階段代號 / 檢查表標題；片段單獨重跑時記為一筆 partial 紀錄
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with run_timer.span(f"{prefix}:{args[arg_index]}"):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+@st.cache_data(ttl=0.5, show_spinner=False)
+def cached_project_version(project_id):
+    # 各 session 每秒輪詢；同一專案的版本查詢在 process 內共用。專案已刪除時回傳 None
+    return get_store().project_version(project_id, missing=None)
+
+@st.fragment(run_every=1)
+def watch_project():
+    # 其他使用者的變更：只拉取此 session 已知版本之後的欄位，與目前畫面不同才整頁重跑套用
+    project_id = st.session_state.active_project
+    version = cached_project_version(project_id)
+    if version is None:
+        cached_project_names.clear()
+        st.rerun(scope="app")  # 專案已被其他 session 刪除，整頁重跑改選現有專案
+    if version > st.session_state._state_version:
+        version, changes, deleted = get_store().changes_since(project_id, st.session_state._state_version)
+        changes = {k: v for k, v in changes.items() if st.session_state.get(k) != v}
+        deleted = {k for k in deleted if k in st.session_state}
+        st.session_state._state_version = version
+        if changes or deleted:
+            st.session_state._remote_changes = (project_id, changes, deleted)
+            st.rerun(scope="app")
+    st.caption(f"🔄 已同步至版本 {st.session_state._state_version}")
+
+def import_projects_file():
+    # 在背景執行緒串流讀取上傳檔、分批寫入資料庫 (不卡住此 session)；錯誤列收在報告中
+    upload = st.session_state.get("import_file")
+    if upload is None:
+        return
+    upload.seek(0)
+    st.session_state._import_job = sop_import.ImportJob(get_store(), upload, upload.name)
+
+def import_running():
+    job = st.session_state.get("_import_job")
+    return job is not None and st.session_state.get("_import_applied") is not job
+
+@st.fragment(run_every=1)
+def import_progress():
+    # 匯入期間每秒更新計數；完成後整頁重跑一次，讓專案選單列出新專案
+    job = st.session_state._import_job
+    if not job.finished:
+        st.info(f"⏳ 匯入中：已匯入 {job.imported} 個專案，{job.error_count} 列錯誤")
+        return
+    st.session_state._import_applied = job
+    cached_project_names.clear()
+    st.rerun(scope="app")
+
+# --- 3.1 專案選擇與載入 (SQLite 持久化) ---
+project_names = cached_project_names()
+if not project_names:
+    try:
+        get_store().create_project("預設專案", template_version=sop_engine.TEMPLATE_VERSION)
+    except sop_store.DuplicateProjectName:
+        pass  # 另一個 session 同時建立了預設專案
+    cached_project_names.clear()
+    project_names = cached_project_names()
+
+if st.session_state.get("active_project") not in project_names:
+    # 重新整理或重置後，從網址參數還原上次的專案
+    qp_project = st.query_params.get("project", "")
+    st.session_state.active_project = (
+        int(qp_project) if qp_project.isdigit() and int(qp_project) in project_names else next(iter(project_names))
+    )
+if st.session_state.get("_loaded_project") != st.session_state.active_project:
+    load_project(st.session_state.active_project)
+remote = st.session_state.pop("_remote_changes", None)
+if remote and remote[0] == st.session_state.active_project:
+    # watch_project 取得的他人變更，須在 widget 建立前寫入 session_state
+    for key in remote[2]:
+        del st.session_state[key]
+    st.session_state.update(restore_dates(remote[1]))
+    if "_tracker" in st.session_state:
+        # 被刪除的勾選 (如其他 session 完成模板遷移) 視為未勾選
+        for key, value in [*remote[1].items(), *((key, False) for key in remote[2])]:
+            if key.startswith("chk_"):
+                st.session_state._tracker.set(key, bool(value))
+if st.query_params.get("project") != str(st.session_state.active_project):
+    st.query_params["project"] = str(st.session_state.active_project)
+for param_key, param_default in sop_engine.PARAM_DEFAULTS.items():
+    if param_key not in st.session_state:
+        st.session_state[param_key] = param_default
+for milestone in sop_schedule.MILESTONES:
+    if sop_schedule.milestone_key(milestone) not in st.session_state:
+        st.session_state[sop_schedule.milestone_key(milestone)] = None
 
 # --- 4. 側邊欄：參數輸入 ---
+PARAM_LABELS = sop_engine.PARAM_LABELS
 with st.sidebar:
+    st.header("📁 專案")
+    st.text_input("搜尋專案", key="project_query", placeholder="輸入名稱關鍵字")
+    st.selectbox(
+        "目前專案", project_options(project_names, st.session_state.active_project),
+        format_func=project_names.get, key="active_project",
+    )
+    if len(project_names) > PROJECT_PICKER_LIMIT:
+        st.caption(f"共 {len(project_names)} 個專案，選單列出最近修改或符合搜尋的前 {PROJECT_PICKER_LIMIT} 個")
+    watch_project()
+    with st.expander("➕ 新增專案"):
+        st.text_input("專案名稱", key="new_project_name")
+        st.button("建立", on_click=create_project)
+        if st.session_state.get("_project_error"): st.error(st.session_state._project_error)
+    with st.expander("🗑️ 刪除專案"):
+        st.checkbox(f"確認刪除「{project_names[st.session_state.active_project]}」(含附件)", key="confirm_delete_project")
+        st.button("刪除", on_click=delete_project, disabled=not st.session_state.get("confirm_delete_project"))
+    with st.expander("📥 批次匯入專案 (.xlsx / .csv)"):
+        st.caption("第一列為欄名：「專案名稱」及側邊欄各參數名稱")
+        st.file_uploader("專案參數檔", type=["xlsx", "csv"], key="import_file")
+        st.button("匯入", on_click=import_projects_file, disabled=st.session_state.get("import_file") is None or import_running())
+        import_job = st.session_state.get("_import_job")
+        if import_running():
+            import_progress()
+        elif import_job is not None:
+            st.success(f"已匯入 {import_job.imported} 個專案")
+            if import_job.error:
+                st.error(f"匯入中斷：{import_job.error}")
+            if import_job.error_count:
+                st.warning(f"{import_job.error_count} 列格式錯誤未匯入")
+                if import_job.report: st.dataframe(import_job.report.errors, hide_index=True)
+
     st.header("⚙️ 專案參數設定")
-    # [關鍵] 使用 key 綁定，確保 session_state 同步
-    project_type = st.radio("案件類型", ["素地新建案", "拆除併建造執照案"], key="kp_project_type")
-    is_demo_project = (project_type == "拆除併建造執照案")
+    # [關鍵] 使用 key 綁定，確保 session_state 同步；on_change 即時寫回專案資料庫
+    st.radio(PARAM_LABELS["project_type"], sop_engine.PROJECT_TYPES, key="kp_project_type", on_change=persist_field, args=("kp_project_type",))
     
     st.divider()
     
     st.subheader("📏 工程與結構規模")
-    project_budget = st.number_input("工程合約經費 (萬元)", value=0, step=10, help="500萬以上需列管B8")
-    base_area = st.number_input("基地/施工面積 (m²)", value=0, step=100)
-    duration_month = st.number_input("預計工期 (月)", value=12, step=1)
-    total_area = st.number_input("總樓地板面積 (m²)", value=0, step=100)
+    st.number_input(PARAM_LABELS["project_budget"], step=10, help="500萬以上需列管B8", key="kp_budget", on_change=persist_field, args=("kp_budget",))
+    st.number_input(PARAM_LABELS["base_area"], step=100, key="kp_base_area", on_change=persist_field, args=("kp_base_area",))
+    st.number_input(PARAM_LABELS["duration_month"], step=1, key="kp_duration", on_change=persist_field, args=("kp_duration",))
+    st.number_input(PARAM_LABELS["total_area"], step=100, key="kp_total_area", on_change=persist_field, args=("kp_total_area",))
     
     with st.expander("詳細結構參數"):
         col_h1, col_h2 = st.columns(2)
         with col_h1:
-            building_height = st.number_input("建築高度 (m)", value=0.0)
-            floors_above = st.number_input("地上層數", value=0)
+            st.number_input(PARAM_LABELS["building_height"], key="kp_height", on_change=persist_field, args=("kp_height",))
+            st.number_input(PARAM_LABELS["floors_above"], step=1, key="kp_floors_above", on_change=persist_field, args=("kp_floors_above",))
         with col_h2:
-            excavation_depth = st.number_input("開挖深度 (m)", value=0.0)
-            floors_below = st.number_input("地下層數", value=0)
-        span_rc = st.number_input("RC最大跨距(m)", value=0.0)
+            st.number_input(PARAM_LABELS["excavation_depth"], key="kp_excavation", on_change=persist_field, args=("kp_excavation",))
+            st.number_input(PARAM_LABELS["floors_below"], step=1, key="kp_floors_below", on_change=persist_field, args=("kp_floors_below",))
+        st.number_input(PARAM_LABELS["span_rc"], key="kp_span_rc", on_change=persist_field, args=("kp_span_rc",))
         
-    is_geo_sensitive = st.checkbox("位於地質敏感區", value=False)
-    is_slope_land_param = st.checkbox("位於山坡地 (結構外審判斷用)", value=False)
+    st.checkbox(PARAM_LABELS["is_geo_sensitive"], key="kp_geo_sensitive", on_change=persist_field, args=("kp_geo_sensitive",))
+    st.checkbox(PARAM_LABELS["is_slope_land"], key="kp_slope_land", on_change=persist_field, args=("kp_slope_land",))
+
+    with st.expander("📅 里程碑日期 (推算各項目到期日)"):
+        for milestone, label in sop_schedule.MILESTONES.items():
+            ms_key = sop_schedule.milestone_key(milestone)
+            st.date_input(label, key=ms_key, format="YYYY-MM-DD", on_change=persist_field, args=(ms_key,))
+
+    # 邏輯判讀 (規則在 sop_engine，與 UI 無關)
+    with run_timer.span("rules"):
+        project_params = sop_engine.params_from_state(st.session_state)
+        sop_rules = sop_engine.evaluate_rules(project_params)
+    is_demo_project = sop_rules.is_demo_project
 
-    # 邏輯判讀
-    pollution_value = base_area * duration_month
-    is_water_plan_needed = pollution_value >= 4600
-    is_b8_needed = base_area >= 500 or project_budget >= 500
-    
-    is_traffic_plan_needed = total_area > 10000
-    is_struct_review_needed = (
-        building_height > 50 or 
-        floors_above > 15 or 
-        excavation_depth > 12 or 
-        floors_below > 3 or 
-        span_rc > 12 or
-        is_slope_land_param or
-        (is_geo_sensitive and (excavation_depth > 7 or floors_below > 1))
-    )
-    is_demo_review_needed = is_demo_project and floors_above > 10
-    
     st.divider()
     if st.button("🔄 強制重置系統"):
         st.session_state.clear()
         st.rerun()
 
 # --- 5. 初始化特殊狀態 Flag ---
-special_flags = [
-    "flag_slope", "flag_public", "flag_expired", 
-    "flag_change", "flag_existing", "flag_demo_included",
-    "flag_demo_dihua", "flag_demo_old", "flag_demo_done", "flag_demo_shelter"
-]
-for flag in special_flags:
+for flag in sop_engine.SPECIAL_FLAGS:
     if flag not in st.session_state:
         st.session_state[flag] = False
 
-# --- 6. Helper Functions (詳細文字) ---
-def get_air_pollution_context():
-    doc_details = []
-    if st.session_state.flag_slope: doc_details.append("★ **山坡地基地**：\n   需檢附合約之「封面、條款、甲乙方、總價金額、用印欄頁及工程項次明細表」等影本 (需全部業主用章)。")
-    if st.session_state.flag_public: doc_details.append("★ **工程契約型(公務)**：\n   1. 工程契約書影本 (含封面、契約價金之給付條款總價頁、甲乙雙人用印頁、工程總表及明細表、決標記錄影本)。\n   2. 業務主管機關之開工證明「正本」。(均需用起造人大小章)。")
-    else: doc_details.append("★ **一般案件**：\n   需檢附合約影本 (含封面、條款、甲乙方、總價金額、用印欄頁)。")
-    if st.session_state.flag_expired: doc_details.append("★ **領照逾6個月**：\n   應檢附「開工展期申請書」影本 (全部業主大小章)。")
-    if st.session_state.flag_change: doc_details.append("★ **變更過起造人/承造人**：\n   應檢附「變更申請書」影本 (全部業主大小章)。")
-    if st.session_state.flag_existing: doc_details.append("★ **基地已有建物**：\n   請加附「建築執照申請書」及「建物概要表」影本 (全部業主大小章)。")
-    if st.session_state.flag_demo_included: doc_details.append("★ **屬建照列管拆照者**：\n   檢附「拆照影本」及「拆照空污費繳費單」影本 (全部業主大小章)。")
-    return "\n\n".join(doc_details)
-
-def get_demolition_context():
-    notes = []
-    notes.append("★ **鄰房鑑定**：需取得公會函件及結論報告。")
-    if st.session_state.flag_demo_dihua: notes.append("   ⚠️ **迪化街區**：強制辦理現況鑑定。")
-    if st.session_state.flag_demo_old: notes.append("   ⚠️ **老舊建物**：需增加安全及補強評估報告。")
-    
-    notes.append("★ **廢棄物處理 (B5/B8)**：")
-    if st.session_state.flag_demo_done:
-        notes.append("   ⚠️ **先行拆除完成**：若無 B5 土方，數量應修正為「0」。")
-    else:
-        notes.append("   1. **土石方 (B5)**：向「建管處施工科」申請。\n   2. **混合物 (B8)**：向「環保局」申辦審查。")
-    
-    notes.append(f"★ **逕流廢水 (二科)**：\n   拆除面積 × 工期 (月) ≥ 4600 者需辦理。")
-    if st.session_state.flag_demo_shelter: notes.append("★ **防空避難**：\n   需函知警察分局辦理撤管。")
-    return "\n\n".join(notes)
-
-# --- 7. 核心 SOP 資料庫 (結構重構：依專案類型組裝) ---
-def get_current_sop_data():
-    # 警語
-    b8_msg = "⚠️ 需辦理 B8 列管 (面積>500m² 或 經費>500萬)" if is_b8_needed else ""
-    water_msg = f"⚠️ 數值 {pollution_value} (達4600) 需辦理" if is_water_plan_needed else "✅ 免辦理"
-    traffic_msg = "⚠️ 強制辦理 (面積>10000m²)" if is_traffic_plan_needed else ""
-    struct_msg = "⚠️ 符合外審條件：需辦理細部設計審查" if is_struct_review_needed else ""
-    demo_msg = "⚠️ 拆除規模>10層：需辦理拆除計畫外審" if is_demo_review_needed else ""
-
-    # --- 1. 定義基礎項目 (通用) ---
-    s0 = [
-        {"item": "建築執照申請作業", "dept": "建築師/建管處", "method": "線上", "timing": "【掛號階段】", "docs": "1. 申請書電子檔\n2. 書圖文件", "critical": "", "details": "透過無紙化審查系統上傳。"},
-        {"item": "領取建造執照", "dept": "建管處", "method": "臨櫃", "timing": "【校對完成後】", "docs": "1. 規費收據", "critical": "", "details": "繳納規費後領取紙本執照。"}
-    ]
-    
-    s1 = [
-        {"item": "空氣污染防制費申報", "dept": "環保局(空噪科)", "method": "線上", "timing": "【開工前】", "docs": "基本：申報書、建照影本", "critical": b8_msg, "details": "DYNAMIC_AP_CONTENT"},
-        {"item": "開工前置-逕流廢水削減計畫", "dept": "環保局(二科)", "method": "線上", "timing": "【開工前】", "docs": "1. 削減計畫書\n2. 沉沙池圖說", "critical": water_msg, "details": "辦理標準：面積 × 工期 ≥ 4600。\n環評基地需先經公會審查。"},
-        {"item": "開工申報 (正式掛號)", "dept": "建管處", "method": "線上", "timing": "【建照後6個月內】", "docs": "⚠️ 確認 NW 開工文件備齊", "critical": "⚠️ 線上掛號後 1 日內需親送正本核對", "details": "需使用 HICOS 憑證元件。"}
-    ]
-    
-    # --- 2. 定義拆除專用項目 ---
-    s1_demo = [
-        {"item": "拆除作業前置 (拆併建專用)", "dept": "相關單位", "method": "混合", "timing": "【開工前】", "docs": "鄰房鑑定、B5/B8核准函", "critical": "⚠️ 拆除案必辦", "details": "DYNAMIC_DEMO_CONTENT"},
-        {"item": "建照科行政驗收抽查", "dept": "建管處", "method": "臨櫃", "timing": "【開工申報前】", "docs": "1. 抽查紀錄表", "critical": "⚠️ 關鍵門檻", "details": "單一拆照或拆併建照案必辦。"},
-        {"item": "撤管防空避難設備", "dept": "警察分局", "method": "紙本", "timing": "【開工前】", "docs": "1. 函知公文", "critical": "", "details": "取得掛件收文戳章。"},
-    ]
-    if is_demo_review_needed:
-        s1_demo.append({"item": "拆除計畫外審", "dept": "相關公會", "method": "會議", "timing": "【開工前】", "docs": "1. 拆除計畫書", "critical": demo_msg, "details": "地上10層以上拆除必辦。"})
-
-    # --- 3. 組裝 Stage 1 (開工) ---
-    # 如果是拆除案，將拆除項目插入到 "開工申報" 之前
-    final_s1 = []
-    if is_demo_project:
-        # 順序：空污 -> 拆除前置 -> 行政驗收 -> 撤管 -> 廢水 -> (外審) -> 開工
-        final_s1.append(s1[0]) # 空污
-        final_s1.extend(s1_demo) # 拆除相關
-        final_s1.append(s1[1]) # 廢水
-        final_s1.append(s1[2]) # 開工
-    else:
-        # 素地案：空污 -> 廢水 -> 開工
-        final_s1 = s1
-
-    # --- 4. 施工計畫 ---
-    s2 = []
-    if is_struct_review_needed:
-        s2.append({"item": "結構外審-細部設計審查", "dept": "結構公會", "method": "會議", "timing": "【放樣前】", "docs": "細部配筋圖、核備函", "critical": struct_msg, "details": "需取得建照科核備。"})
-        s2.append({"item": "施工計畫說明會 (外審)", "dept": "相關公會", "method": "會議", "timing": "【核定前】", "docs": "施工計畫書、簡報", "critical": struct_msg, "details": "深開挖/高樓層/大跨距。"})
-    
-    if is_traffic_plan_needed:
-        s2.append({"item": "交通維持計畫", "dept": "交通局", "method": "紙本", "timing": "【施工計畫前】", "docs": "交維計畫書", "critical": traffic_msg, "details": "樓地板>10000m²。"})
-        
-    s2.append({"item": "施工計畫書核備 (上傳)", "dept": "建管處", "method": "線上", "timing": "【放樣前】", "docs": "⚠️ 確認 NW 文件備齊", "critical": "", "details": "掃描 A3(圖說)/A4 PDF。配筋圖需公會用印。"})
-    
-    if is_demo_project:
-        s2.append({"item": "舊屋拆除與廢棄物結案", "dept": "環保局", "method": "線上", "timing": "【拆除後】", "docs": "結案申報書", "critical": "⚠️ B5/B8 未結案，無法放樣", "details": "拆除完成後需解除列管。"})
-
-    # --- 5. 導溝 & 放樣 ---
-    s3 = [{"item": "導溝勘驗申報", "dept": "建管處", "method": "線上", "timing": "【施工前2日】", "docs": "申請書、照片", "critical": "", "details": ""}]
-    
-    s4 = [
-        {"item": "放樣前置-用水/電/汙水核備", "dept": "自來水/台電", "method": "紙本", "timing": "【放樣前】", "docs": "核備公函", "critical": "", "details": "5樓/5戶/2000m²以下免辦。"},
-        {"item": "放樣勘驗申報", "dept": "建管處", "method": "線上", "timing": "【結構施工前】", "docs": "⚠️ 確認 NS 文件備齊", "critical": "⚠️ 現場不得先行施工", "details": "網路核備後，送紙本掛件。"}
-    ]
-    if is_demo_project:
-        # 拆除案在放樣前要加地界複丈
-        s4.insert(1, {"item": "地界複丈/路心樁復原", "dept": "地政", "method": "臨櫃", "timing": "【拆除後】", "docs": "複丈申請書", "critical": "", "details": "拆除後重測地界。"})
-
-    # 回傳組裝好的資料
-    return {
-        "stage_0": s0,
-        "stage_1": final_s1,
-        "stage_2": s2,
-        "stage_3": s3,
-        "stage_4": s4
-    }
+# 有建照核發日時，「領取建照逾 6 個月」由日期推算，不再手動勾選
+milestones = sop_schedule.milestones_from_state(st.session_state)
+permit_expired = sop_schedule.permit_expired(milestones)
+if permit_expired is not None and st.session_state.flag_expired != permit_expired:
+    st.session_state.flag_expired = permit_expired
+    persist_field("flag_expired")
 
 # --- 8. 狀態同步與初始化 ---
-sop_data = get_current_sop_data() # 根據最新的 project_type 產生資料
+with run_timer.span("get_sop"):
+    sop_data = sop_engine.get_sop(project_params) # 根據最新的專案參數產生資料 (已編譯、唯讀)
+
+# 專案或模板組成改變時，重建此專案在進度彙總中的項目 (之後勾選皆為增量更新)
+progress_sync_key = (st.session_state.active_project, sop_engine.sop_signature(sop_rules))
+if st.session_state.get("_progress_synced") != progress_sync_key:
+    with run_timer.span("progress_sync"):
+        get_store().sync_progress(st.session_state.active_project, *sop_engine.progress_scopes(project_params))
+    st.session_state._progress_synced = progress_sync_key
+
+# 各項目到期日：里程碑或模板組成改變時才重寫此專案在 due_index 的資料
+with run_timer.span("schedule"):
+    due_fingerprint, due_entries = sop_schedule.schedule(sop_data, milestones)
+    if st.session_state.get("_due_synced") != (st.session_state.active_project, due_fingerprint):
+        get_store().sync_due_dates(st.session_state.active_project, due_fingerprint, due_entries)
+        st.session_state._due_synced = (st.session_state.active_project, due_fingerprint)
+    due_dates = {chk_key: due for chk_key, _, _, due in due_entries}
+    today_iso = date.today().isoformat()
+
+with run_timer.span("attachments"):
+    refresh_attachments()
 
 # 初始化 Session State (Status Hydration)
-for stage, items in sop_data.items():
-    for item in items:
-        # 使用 item 名稱作為 key，確保切換專案類型時，相同項目的狀態保留 (或重置，視需求)
-        # 這裡我們希望相同項目保留，但不同專案類型的獨有項目互不干擾
-        key = generate_key(stage, item['item'])
-        chk_key = f"chk_{key}"
-        note_key = f"note_{key}"
-        
-        # 確保 Key 存在，避免 KeyError
-        if chk_key not in st.session_state:
-            st.session_state[chk_key] = False
-        
-        # 將狀態寫入 data 用於顯示，但不依賴 data 存儲
-        item['done'] = st.session_state[chk_key]
-        item['note'] = st.session_state.get(note_key, "")
-
-# 定義檢查表
-def get_checklists():
-    # 這裡放完整的清單，渲染時再過濾
-    # (為了節省篇幅，這裡使用 V19.0 的完整清單)
-    list_start = [
-        ("NW0100", "開工", "建築工程開工申報書", "", False), ("NW0500", "開工", "建築執照正本", "", False),
-        ("NW1000", "開工", "空污費收據", "", False), ("NW1100", "開工", "逕流廢水核備", "", False),
-        ("NW2400", "開工", "拆除施工計畫書", "", True), ("NW2500", "開工", "監拆報告書", "", True),
-        ("NW2600", "開工", "拆除B5備查", "", True), ("NW2700", "開工", "拆除B8備查", "", True),
-        ("NW2900", "開工", "塔吊檢查表", "無則附切結", False)
-    ]
-    list_plan = [
-        ("NW3300", "計畫", "施工計畫書", "", False), ("NW5000", "計畫", "配筋圖(A3)", "公會用印", False),
-        ("NW5300", "計畫", "交維計畫核准", "1萬m²以上", False), ("NW5700", "計畫", "觀測系統", "深開挖", False)
-    ]
-    list_ns = [
-        ("NS0100", "放樣", "勘驗申報書", "", False), ("NS0900", "放樣", "現場照片", "", False),
-        ("NS1100", "放樣", "鋼筋保證書", "", False), ("NS2100", "放樣", "放樣切結書", "", False)
-    ]
-    return list_start, list_plan, list_ns
-
-# 初始化檢查表狀態
-chk_lists = get_checklists()
-for lst in chk_lists:
-    for code, cat, _, _, _ in lst:
-        k = f"chk_{code}_{cat}"
-        if k not in st.session_state: st.session_state[k] = False
+# export_progress 為本次 rerun 的勾選/備註快照，供下載時才產生 Excel
+with run_timer.span("hydration"):
+    export_progress = {}
+    for stage, items in sop_data.items():
+        export_progress[stage] = []
+        for item in items:
+            # key 由 stage + item 名稱產生 (編譯時預先算好)，切換專案類型時相同項目的狀態保留，
+            # 不同專案類型的獨有項目互不干擾
+            chk_key = item['chk_key']
+
+            # 確保 Key 存在，避免 KeyError
+            if chk_key not in st.session_state:
+                st.session_state[chk_key] = False
+
+            export_progress[stage].append((st.session_state[chk_key], st.session_state.get(item['note_key'], "")))
+
+    # 初始化檢查表狀態
+    chk_lists = sop_engine.get_checklists()
+    for lst in chk_lists:
+        for code, cat, _, _, _ in lst:
+            k = sop_engine.checklist_key(code, cat)
+            if k not in st.session_state: st.session_state[k] = False
 
 # --- 9. 渲染函數 ---
+# 每個階段與每份檢查表都是獨立的 fragment：勾選只重跑該片段，不重跑整個腳本。
+# 片段之間只透過階段解鎖狀態 (tracker) 互動，解鎖狀態改變時才整頁重跑。
+@st.fragment
+@timed_fragment("render_stage")
 def render_stage_detailed(stage_key, is_locked=False):
     stage_items = sop_data[stage_key] # 使用已過濾組裝好的資料
     
@@ -278,15 +448,15 @@ def render_stage_detailed(stage_key, is_locked=False):
         # 因為資料已經在 get_current_sop_data 篩選過，這裡不需要再判斷 demo_only
         # 直接渲染即可
         
-        chk_key = f"chk_{generate_key(stage_key, item['item'])}"
-        note_key = f"note_{generate_key(stage_key, item['item'])}"
+        chk_key = item['chk_key']
+        note_key = item['note_key']
 
         with st.container():
             col1, col2 = st.columns([0.5, 9.5])
             
             with col1:
                 # 原生 checkbox，狀態直接綁定 session_state
-                st.checkbox("", key=chk_key, disabled=is_locked)
+                st.checkbox("", key=chk_key, disabled=is_locked, on_change=persist_field, args=(chk_key,))
                 is_checked = st.session_state[chk_key]
 
             with col2:
@@ -294,13 +464,16 @@ def render_stage_detailed(stage_key, is_locked=False):
                 method_tag = f'<span class="tag-online">🔵 線上</span>' if method == "線上" else f'<span class="tag-paper">🟤 {method}</span>'
                 
                 title_html = f"**{item['item']}** {method_tag} <span style='color:#666; font-size:0.9em'>(🏢 {item['dept']})</span>"
+                due = due_dates.get(chk_key)
+                if due:
+                    title_html += f' <span class="tag-overdue">⏰ 逾期 {due}</span>' if due < today_iso else f' <span class="tag-due">📅 {due}</span>'
                 
                 if is_checked: 
                     st.markdown(f"<span style='color:#2E7D32; font-weight:bold;'>✅ {item['item']}</span>", unsafe_allow_html=True)
                 else: 
                     st.markdown(title_html, unsafe_allow_html=True)
                 
-                if item.get("critical"): st.markdown(f"<div class='critical-info'>{item['critical']}</div>", unsafe_allow_html=True)
+                if item.get("critical"): st.markdown(f"<div class='critical-info'>{sop_engine.critical_text(item, sop_rules)}</div>", unsafe_allow_html=True)
 
                 # 空污費詳細區塊
                 if item['item'] == "空氣污染防制費申報":
@@ -308,36 +481,39 @@ def render_stage_detailed(stage_key, is_locked=False):
                         st.markdown("""<div class='special-context'><b>🚩 特殊案件條件勾選：</b>""", unsafe_allow_html=True)
                         c1, c2 = st.columns(2)
                         with c1:
-                            st.checkbox("位於山坡地基地", key="flag_slope")
-                            st.checkbox("屬工程契約型 (公務)", key="flag_public")
-                            st.checkbox("領取建照逾 6 個月", key="flag_expired")
+                            st.checkbox("位於山坡地基地", key="flag_slope", on_change=persist_field, args=("flag_slope",))
+                            st.checkbox("屬工程契約型 (公務)", key="flag_public", on_change=persist_field, args=("flag_public",))
+                            st.checkbox("領取建照逾 6 個月", key="flag_expired", on_change=persist_field, args=("flag_expired",),
+                                        disabled=permit_expired is not None, help="已填建照核發日時自動判斷")
                         with c2:
-                            st.checkbox("曾變更起造人/承造人", key="flag_change")
-                            st.checkbox("基地已有建物 (如學校)", key="flag_existing")
-                            st.checkbox("屬建照列管拆照者", key="flag_demo_included")
+                            st.checkbox("曾變更起造人/承造人", key="flag_change", on_change=persist_field, args=("flag_change",))
+                            st.checkbox("基地已有建物 (如學校)", key="flag_existing", on_change=persist_field, args=("flag_existing",))
+                            st.checkbox("屬建照列管拆照者", key="flag_demo_included", on_change=persist_field, args=("flag_demo_included",))
                         st.markdown("</div>", unsafe_allow_html=True)
                         
-                        dynamic_details = get_air_pollution_context()
+                        dynamic_details = sop_engine.get_air_pollution_context(st.session_state)
                         st.markdown(f"**📄 自動產生應備文件清單：**\n\n{dynamic_details}")
                         st.markdown("---")
                         st.markdown(f"**💡 作業指引：**\n臺北市營建工程空污費網路申報系統 (02-27208889 #7252)")
-                        st.text_input("備註", key=note_key)
+                        st.text_input("備註", key=note_key, on_change=persist_field, args=(note_key,))
+                        render_attachments(chk_key)
                 
                 elif item['item'] == "拆除作業前置 (拆併建專用)":
                     with st.expander("🔽 詳細指引與檢核 (拆除條件)", expanded=False):
                         st.markdown("""<div class='special-context'><b>🚩 拆除條件勾選：</b>""", unsafe_allow_html=True)
                         c1, c2 = st.columns(2)
                         with c1:
-                            st.checkbox("屬大同區迪化街區", key="flag_demo_dihua")
-                            st.checkbox("鄰房屬老舊建物", key="flag_demo_old")
+                            st.checkbox("屬大同區迪化街區", key="flag_demo_dihua", on_change=persist_field, args=("flag_demo_dihua",))
+                            st.checkbox("鄰房屬老舊建物", key="flag_demo_old", on_change=persist_field, args=("flag_demo_old",))
                         with c2:
-                            st.checkbox("先行拆除完成 (無B5土方)", key="flag_demo_done")
-                            st.checkbox("舊建物有防空避難設備", key="flag_demo_shelter")
+                            st.checkbox("先行拆除完成 (無B5土方)", key="flag_demo_done", on_change=persist_field, args=("flag_demo_done",))
+                            st.checkbox("舊建物有防空避難設備", key="flag_demo_shelter", on_change=persist_field, args=("flag_demo_shelter",))
                         st.markdown("</div>", unsafe_allow_html=True)
                         
-                        demo_details = get_demolition_context()
+                        demo_details = sop_engine.get_demolition_context(st.session_state)
                         st.markdown(f"**📄 應備項目與注意事項：**\n\n{demo_details}")
-                        st.text_input("備註", key=note_key)
+                        st.text_input("備註", key=note_key, on_change=persist_field, args=(note_key,))
+                        render_attachments(chk_key)
                 
                 else:
                     with st.expander("🔽 詳細指引與備註", expanded=False):
@@ -345,88 +521,112 @@ def render_stage_detailed(stage_key, is_locked=False):
                         st.markdown(f"**📄 文件：**\n{item['docs']}")
                         if item['details'] and "DYNAMIC" not in item['details']: 
                             st.markdown(f"<div class='info-box'>💡 <b>指引：</b><br>{item['details']}</div>", unsafe_allow_html=True)
-                        st.text_input("備註", key=note_key)
+                        st.text_input("備註", key=note_key, on_change=persist_field, args=(note_key,))
+                        render_attachments(chk_key)
         st.divider()
 
+    # 片段重跑時同步本階段的匯出快照，下載按鈕 (位於片段外) 才不會拿到舊狀態
+    export_progress[stage_key] = [
+        (st.session_state.get(item['chk_key'], False), st.session_state.get(item['note_key'], ""))
+        for item in stage_items
+    ]
+    if tracker.generation != unlock_generation:
+        st.rerun()
+
+@st.fragment
+@timed_fragment("render_checklist", arg_index=1)
 def render_checklist(checklist_data, title):
     with st.expander(f"📑 {title} (點擊展開)", expanded=False):
         for code, cat, name, note, demo_only in checklist_data:
             if demo_only and not is_demo_project: continue
             
-            c1, c2, c3 = st.columns([0.5, 4, 5.5])
-            key = f"chk_{code}_{cat}"
-            st.checkbox("", key=key)
+            c1, c2, c3, c4 = st.columns([0.5, 4, 4.3, 1.2])
+            key = sop_engine.checklist_key(code, cat)
+            st.checkbox("", key=key, on_change=persist_field, args=(key,))
             is_checked = st.session_state[key]
             
             with c2: 
                 style = "color:#2E7D32; font-weight:bold;" if is_checked else ""
                 st.markdown(f"<span style='{style}'>{code} {name}</span>", unsafe_allow_html=True)
             with c3: st.caption(f"🖊️ {note}")
+            with c4: render_attachments(key)
+
+    # 檢查表也可能是其他階段的前置 (STAGE_DEPENDENCIES)，解鎖狀態改變時同樣整頁重跑
+    if tracker.generation != unlock_generation:
+        st.rerun()
 
 # --- 10. 解鎖邏輯 (Status Check) ---
-def check_stage_complete(stage_key):
-    items = sop_data[stage_key]
-    for item in items:
-        # 因為資料已經過濾過，我們只需要檢查清單內的所有項目是否完成
-        key = f"chk_{generate_key(stage_key, item['item'])}"
-        if not st.session_state.get(key, False):
-            return False
-    return True
-
-s0_done = check_stage_complete('stage_0')
-s1_done = check_stage_complete('stage_1')
-s2_done = check_stage_complete('stage_2')
+# 依 sop_engine.STAGE_DEPENDENCIES 建立依賴圖；各節點剩餘項目數在勾選時 (persist_field) 增量更新，
+# 只有專案或模板組成改變時才重建
+if st.session_state.get("_tracker_key") != progress_sync_key:
+    with run_timer.span("tracker_build"):
+        _, progress_groups = sop_engine.progress_scopes(project_params)
+        st.session_state._tracker = sop_progress.ProgressTracker(
+            {scope: tuple(k for k, _ in entries) for scope, entries in progress_groups.items()},
+            sop_engine.STAGE_DEPENDENCIES,
+            checked=[k for entries in progress_groups.values() for k, _ in entries if st.session_state.get(k)],
+        )
+    st.session_state._tracker_key = progress_sync_key
+tracker = st.session_state._tracker
+
+# 解鎖狀態的版本：片段重跑後若不同，代表其他分頁的解鎖狀態改變，需整頁重跑
+unlock_generation = tracker.generation
 
 # --- 11. 主畫面 ---
 tabs = st.tabs(["0.建照領取", "1.開工申報(NW)", "2.施工計畫(NW)", "3.導溝勘驗", "4.放樣勘驗(NS)"])
 
 with tabs[0]:
     st.subheader("🔑 階段零：建照領取")
-    render_stage_detailed("stage_0", is_locked=False)
+    render_stage_detailed("stage_0", is_locked=not tracker.is_unlocked("stage_0"))
 
 with tabs[1]:
     st.subheader("📋 階段一：開工申報 (含NW開工文件)")
-    if not s0_done: st.markdown('<div class="locked-stage">🔒 請先完成建照領取</div>', unsafe_allow_html=True)
+    if not tracker.is_unlocked("stage_1"): st.markdown('<div class="locked-stage">🔒 請先完成建照領取</div>', unsafe_allow_html=True)
     else:
-        render_checklist(get_checklists()[0], "NW 開工文件準備檢查表") # List 0 is Start
+        render_checklist(chk_lists[0], "NW 開工文件準備檢查表") # List 0 is Start
         st.markdown("---")
         render_stage_detailed("stage_1", is_locked=False)
 
 with tabs[2]:
     st.subheader("📘 階段二：施工計畫 (含NW計畫文件)")
-    if not (s0_done and s1_done): st.markdown('<div class="locked-stage">🔒 請先完成開工申報</div>', unsafe_allow_html=True)
+    if not tracker.is_unlocked("stage_2"): st.markdown('<div class="locked-stage">🔒 請先完成開工申報</div>', unsafe_allow_html=True)
     else:
-        render_checklist(get_checklists()[1], "NW 施工計畫文件準備檢查表") # List 1 is Plan
+        render_checklist(chk_lists[1], "NW 施工計畫文件準備檢查表") # List 1 is Plan
         st.markdown("---")
         render_stage_detailed("stage_2", is_locked=False)
 
 with tabs[3]:
     st.subheader("🚧 階段三：導溝勘驗")
-    render_stage_detailed("stage_3", is_locked=not (s0_done and s1_done and s2_done))
+    render_stage_detailed("stage_3", is_locked=not tracker.is_unlocked("stage_3"))
 
 with tabs[4]:
     st.subheader("📐 階段四：放樣勘驗 (含NS勘驗文件)")
-    if not (s0_done and s1_done and s2_done): st.markdown('<div class="locked-stage">🔒 請先完成施工計畫</div>', unsafe_allow_html=True)
+    if not tracker.is_unlocked("stage_4"): st.markdown('<div class="locked-stage">🔒 請先完成施工計畫</div>', unsafe_allow_html=True)
     else:
-        render_checklist(get_checklists()[2], "NS 放樣勘驗文件準備檢查表") # List 2 is NS
+        render_checklist(chk_lists[2], "NS 放樣勘驗文件準備檢查表") # List 2 is NS
         st.markdown("---")
         render_stage_detailed("stage_4", is_locked=False)
 
 # --- 12. Excel 下載 ---
+# 工作簿僅在按下下載時產生 (於背景執行緒)，並依狀態雜湊快取於 sop_export
 st.write("---")
-buffer = io.BytesIO()
-with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-    all_rows = []
-    for k, v in sop_data.items():
-        for item in v:
-            key = f"chk_{generate_key(k, item['item'])}"
-            item['done'] = st.session_state.get(key, False)
-            item['note'] = st.session_state.get(f"note_{generate_key(k, item['item'])}", "")
-            
-            item_copy = item.copy()
-            item_copy['階段代號'] = k
-            all_rows.append(item_copy)
-    
-    if all_rows: pd.DataFrame(all_rows).to_excel(writer, index=False, sheet_name='SOP流程')
-    
-st.download_button("📥 下載完整 Excel", buffer.getvalue(), f"SOP_Full_V{CURRENT_VERSION}_{date.today()}.xlsx", "application/vnd.ms-excel")
\ No newline at end of file
+st.download_button(
+    "📥 下載完整 Excel",
+    sop_metrics.timed(run_timer.recorder, run_timer.page, "excel_build",
+                      functools.partial(sop_export.workbook_bytes, sop_data, export_progress, sop_rules)),
+    f"SOP_Full_V{CURRENT_VERSION}_{date.today()}.xlsx",
+    "application/vnd.ms-excel",
+)
+
+# --- 13. 效能量測面板 (?debug=1) ---
+if st.query_params.get("debug") == "1":
+    with st.expander("🩺 效能量測 (rerun 分解 / 滾動百分位數)", expanded=True):
+        last_run = st.session_state.get("_metrics_last_run")
+        if last_run:
+            st.caption(f"上一次整頁 rerun：{last_run['total_ms']:.1f} ms")
+            st.dataframe(
+                [{"span": name, "ms": round(ms, 2)} for name, ms in sorted(last_run["spans"].items(), key=lambda kv: -kv[1])],
+                hide_index=True,
+            )
+        st.dataframe(run_timer.recorder.summary(), hide_index=True)
+st.session_state._metrics_last_run = run_timer.finish()
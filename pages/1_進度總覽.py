@@ -0,0 +1,92 @@
+import streamlit as st
+import plotly.express as px
+
+import sop_engine
+import sop_metrics
+import sop_store
+
+# --- 1. 頁面設定 ---
+st.set_page_config(page_title="專案進度總覽", page_icon="📊", layout="wide")
+run_timer = sop_metrics.RunTimer("dashboard")
+st.title("📊 專案進度總覽")
+st.caption("資料來自勾選時增量更新的彙總計數，不逐一掃描各專案狀態")
+
+@st.cache_resource(show_spinner=False)
+def get_store():
+    return sop_store.ProjectStore()
+
+store = get_store()
+
+# --- 2. 補建彙總 (尚未開啟過的舊專案) ---
+with st.spinner("建立尚未開啟過的專案的進度彙總..."), run_timer.span("backfill"):
+    sop_engine.backfill_progress(store)
+
+scopes = list(sop_engine.STAGE_KEYS) + list(sop_engine.CHECKLIST_SCOPES)
+with run_timer.span("aggregates"):
+    totals = {scope: (total, done) for scope, total, done in store.portfolio_totals()}
+    project_count = len(store.list_projects())
+
+# --- 3. 各階段 / 檢查表完成率 ---
+c1, c2, c3 = st.columns(3)
+c1.metric("專案數", project_count)
+all_total = sum(totals.get(s, (0, 0))[0] for s in sop_engine.STAGE_KEYS)
+all_done = sum(totals.get(s, (0, 0))[1] for s in sop_engine.STAGE_KEYS)
+c2.metric("SOP 項目完成率", f"{all_done / all_total:.0%}" if all_total else "—")
+cl_total = sum(totals.get(s, (0, 0))[0] for s in sop_engine.CHECKLIST_SCOPES)
+cl_done = sum(totals.get(s, (0, 0))[1] for s in sop_engine.CHECKLIST_SCOPES)
+c3.metric("NW/NS 文件備齊率", f"{cl_done / cl_total:.0%}" if cl_total else "—")
+
+ratio_rows = [
+    {
+        "範圍": sop_engine.SCOPE_LABELS[scope],
+        "類別": "SOP 階段" if scope in sop_engine.STAGE_KEYS else "NW/NS 檢查表",
+        "完成率": totals[scope][1] / totals[scope][0] if totals.get(scope, (0, 0))[0] else 0.0,
+        "完成/總數": f"{totals.get(scope, (0, 0))[1]}/{totals.get(scope, (0, 0))[0]}",
+    }
+    for scope in scopes
+]
+fig = px.bar(ratio_rows, x="範圍", y="完成率", color="類別", text="完成/總數", range_y=[0, 1])
+fig.update_layout(yaxis_tickformat=".0%", height=360, margin=dict(t=20, b=20))
+st.plotly_chart(fig)
+
+# --- 4. 專案分布 (彙總後繪圖，專案數再多也只有少量資料點) ---
+col_l, col_r = st.columns(2)
+with col_l:
+    st.subheader("🚦 專案目前所在階段")
+    reached = dict(store.stage_reached(sop_engine.STAGE_KEYS))
+    stage_names = [sop_engine.SCOPE_LABELS[s] for s in sop_engine.STAGE_KEYS] + ["全部完成"]
+    fig = px.bar(
+        {"階段": stage_names, "專案數": [reached.get(i, 0) for i in range(len(stage_names))]},
+        x="階段", y="專案數",
+    )
+    fig.update_layout(height=320, margin=dict(t=20, b=20))
+    st.plotly_chart(fig)
+with col_r:
+    st.subheader("📈 整體完成率分布")
+    bins = 10
+    hist = dict(store.completion_histogram(bins))
+    fig = px.bar(
+        {
+            "完成率": [f"{i * 100 // bins}–{(i + 1) * 100 // bins}%" for i in range(bins)],
+            "專案數": [hist.get(i, 0) for i in range(bins)],
+        },
+        x="完成率", y="專案數",
+    )
+    fig.update_layout(height=320, margin=dict(t=20, b=20))
+    st.plotly_chart(fig)
+
+# --- 5. 卡關項目 ---
+st.subheader("🔒 卡關項目 (各階段未完成專案數最多者)")
+pending = store.pending_items(sop_engine.STAGE_KEYS, limit=5)
+if not pending:
+    st.info("目前沒有未完成項目")
+else:
+    rows = [
+        {"範圍": sop_engine.SCOPE_LABELS.get(scope, scope), "項目": label, "未完成專案數": count}
+        for scope, label, count in pending
+    ]
+    fig = px.bar(rows, x="未完成專案數", y="項目", color="範圍", orientation="h")
+    fig.update_layout(height=max(320, 24 * len(rows)), margin=dict(t=20, b=20), yaxis={"categoryorder": "total ascending"})
+    st.plotly_chart(fig)
+
+run_timer.finish()
@@ -0,0 +1,70 @@
+import html
+import os
+
+import streamlit as st
+
+import sop_blobs
+import sop_jobs
+import sop_store
+
+# --- 1. 頁面設定 ---
+st.set_page_config(page_title="批次匯出", page_icon="📦", layout="wide")
+st.title("📦 批次匯出 SOP 工作簿")
+st.caption("在背景以多個 process 產生各專案的 Excel，逐一寫入磁碟上的 zip；匯出期間可繼續操作其他頁面")
+
+@st.cache_resource(show_spinner=False)
+def get_store():
+    return sop_store.ProjectStore()
+
+@st.cache_resource(show_spinner=False)
+def get_export_queue():
+    return sop_jobs.ExportQueue(get_store())
+
+queue = get_export_queue()
+project_names = dict(get_store().list_projects())
+
+# --- 2. 建立匯出工作 ---
+selected = st.multiselect(
+    "匯出專案 (預設全部)", list(project_names), default=list(project_names), format_func=project_names.get
+)
+if st.button("🚀 開始匯出", disabled=not selected, type="primary"):
+    queue.submit(selected)
+st.caption(f"Worker 數：{queue.max_workers}；輸出目錄：{queue.export_dir}")
+
+# --- 3. 工作進度 (每秒更新，只重跑此片段) ---
+def read_file(path):
+    # 只在 zip 無法由靜態檔服務提供時使用 (超過 200 MB 或輸出目錄不在 static/ 下)：整個檔案會讀進記憶體
+    with open(path, "rb") as f:
+        return f.read()
+
+@st.fragment(run_every=1)
+def job_list():
+    jobs = queue.jobs()
+    if not jobs:
+        st.info("尚無匯出工作")
+        return
+    for job in jobs:
+        with st.container(border=True):
+            st.progress(job.done / job.total if job.total else 1.0, text=f"#{job.id}　{job.done}/{job.total} 個專案　{job.status}")
+            if not job.finished:
+                st.button("取消", key=f"cancel_{job.id}", on_click=job.cancel)
+            elif job.status != "failed" and os.path.exists(job.path):
+                filename = os.path.basename(job.path)
+                url = sop_blobs.static_url(job.path)
+                if url:
+                    # 由 Streamlit 靜態檔服務串流，不經過此 session 的記憶體
+                    st.markdown(f'<a href="{url}" download="{html.escape(filename)}">📥 下載 {html.escape(filename)}</a>', unsafe_allow_html=True)
+                else:
+                    st.download_button(
+                        f"📥 下載 {filename}",
+                        lambda path=job.path: read_file(path),
+                        filename,
+                        "application/zip",
+                        key=f"download_{job.id}",
+                    )
+                    st.caption("檔案超過靜態檔上限或不在 static/ 下，下載時會整個讀入記憶體")
+            if job.errors:
+                st.warning(f"{len(job.errors)} 個專案匯出失敗")
+                st.dataframe([{"專案": name, "錯誤": message} for name, message in job.errors], hide_index=True)
+
+job_list()
@@ -0,0 +1,50 @@
+from datetime import date, timedelta
+
+import streamlit as st
+
+import sop_engine
+import sop_schedule
+import sop_store
+
+# --- 1. 頁面設定 ---
+st.set_page_config(page_title="到期提醒", page_icon="⏰", layout="wide")
+st.title("⏰ 到期提醒")
+st.caption("依各專案里程碑日期推算的到期日 (未完成項目)；查詢走到期日索引，不逐一掃描專案")
+
+@st.cache_resource(show_spinner=False)
+def get_store():
+    return sop_store.ProjectStore()
+
+store = get_store()
+
+# --- 2. 補建到期日索引 (尚未開啟過的舊專案) ---
+if store.projects_without_due_index():
+    with st.spinner("建立到期日索引..."):
+        sop_schedule.backfill_due_index(store)
+
+# --- 3. 逾期 / 即將到期 ---
+days = st.slider("列出幾天內到期", 1, 60, 7)
+today = date.today()
+
+def show(rows, empty_text):
+    if not rows:
+        st.info(empty_text)
+        return
+    st.dataframe(
+        [
+            {"到期日": due, "專案": name, "階段": sop_engine.SCOPE_LABELS.get(stage, stage), "項目": label}
+            for due, _, name, stage, label in rows
+        ],
+        hide_index=True,
+    )
+
+overdue = store.due_items(today.isoformat())
+upcoming = store.due_items((today + timedelta(days=days)).isoformat(), since=today.isoformat())
+c1, c2 = st.columns(2)
+c1.metric("逾期項目", len(overdue))
+c2.metric(f"{days} 天內到期", len(upcoming))
+
+st.subheader("🚨 已逾期")
+show(overdue, "沒有逾期項目")
+st.subheader(f"📅 {days} 天內到期")
+show(upcoming, "近期沒有到期項目")
@@ -0,0 +1,63 @@
+import time
+
+import streamlit as st
+
+import sop_engine
+import sop_search
+import sop_store
+
+# --- 1. 頁面設定 ---
+st.set_page_config(page_title="全文檢索", page_icon="🔍", layout="wide")
+st.title("🔍 全文檢索")
+st.caption("搜尋 SOP 項目、承辦單位、文件、指引、NW/NS 檢查表代碼與各專案備註；多個關鍵字以空白分隔")
+
+@st.cache_resource(show_spinner=False)
+def get_store():
+    return sop_store.ProjectStore()
+
+store = get_store()
+
+# 「尚未完成」依進度彙總判斷，先補建從未開啟過的專案
+with st.spinner("建立尚未開啟過的專案的進度彙總..."):
+    sop_engine.backfill_progress(store)
+
+query = st.text_input("關鍵字", placeholder="例：NW2700 拆除B8備查、鄰房鑑定")
+if not query.strip():
+    st.stop()
+
+start = time.perf_counter()
+template_hits = sop_search.template_index().search(query)
+note_hits = sop_search.search_notes(store, query)
+lacking = {hit.chk_key: store.projects_lacking(hit.chk_key) for hit in template_hits}
+st.caption(f"{len(template_hits)} 個項目、{len(note_hits)} 則備註，{(time.perf_counter() - start) * 1000:.1f} ms")
+
+# --- 2. SOP 項目 / 檢查表 ---
+st.subheader("📋 SOP 項目與檢查表")
+if not template_hits:
+    st.info("沒有符合的項目")
+for hit in template_hits:
+    projects = lacking[hit.chk_key]
+    label = f"{sop_engine.SCOPE_LABELS.get(hit.scope, hit.scope)}｜{hit.title}｜尚未完成：{len(projects)} 個專案"
+    with st.expander(label):
+        if hit.field != "title":
+            st.caption(hit.text)
+        if projects:
+            st.dataframe([{"專案": name} for _, name in projects], hide_index=True)
+
+# --- 3. 備註 ---
+st.subheader("🖊️ 備註")
+if not note_hits:
+    st.info("沒有符合的備註")
+else:
+    note_titles = sop_search.template_index().note_titles
+    st.dataframe(
+        [
+            {
+                "專案": name,
+                "項目": note_titles.get(note_key, ("", note_key))[1],
+                "備註": text,
+            }
+            for _, name, note_key, text in note_hits
+        ],
+        hide_index=True,
+    )
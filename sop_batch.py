@@ -0,0 +1,125 @@
+# --- 批次評估 (專案組合) ---
+# 以 DataFrame 一次評估整批專案的 SOP 規則：規則為欄位運算 (NumPy/pandas)，
+# 應辦項目依「不同的參數組合」展開 (最多數十種)，不對每個專案跑 Python 迴圈。
+import pandas as pd
+
+import sop_engine
+import sop_import
+
+# 決定模板內容的規則欄位 (對應 sop_engine.SopSignature)
+SIGNATURE_RULES = [
+    "is_demo_project", "is_b8_needed", "is_water_plan_needed",
+    "is_traffic_plan_needed", "is_struct_review_needed", "is_demo_review_needed",
+]
+CHECKLIST_STAGE = "checklist"
+
+
+def _bool_column(series, default, field):
+    # 是/否欄位：布林與數字直接判讀，文字依 sop_import 的是/否詞彙 (非空字串不一律視為是)；無法判讀即報錯
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    missing = series.isna()
+    numeric = pd.to_numeric(series.where(~series.map(type).eq(str)), errors="coerce")
+    text = series.astype(str).str.strip().str.casefold()
+    is_true, is_false = text.isin(sop_import.TRUE_TEXT), text.isin(sop_import.FALSE_TEXT)
+    invalid = ~missing & numeric.isna() & ~is_true & ~is_false
+    if invalid.any():
+        raise ValueError(f"{sop_engine.PARAM_LABELS[field]}：無法判讀為是/否：{series[invalid].iloc[0]!r}")
+    return numeric.ne(0).where(numeric.notna(), is_true).where(~missing, default).astype(bool)
+
+
+def _number_column(series, default, field):
+    # 數值欄位：文字去除千分位逗號 (同 sop_import)；空白視為未填，其餘無法判讀即報錯 (不默默當成 0)
+    if pd.api.types.is_numeric_dtype(series):
+        return series.fillna(default)
+    is_text = series.map(type).eq(str)
+    cleaned = series.where(~is_text, series.astype(str).str.strip().str.replace(",", "", regex=False))
+    missing = series.isna() | (is_text & cleaned.eq(""))
+    numeric = pd.to_numeric(cleaned.where(~missing), errors="coerce")
+    invalid = ~missing & numeric.isna()
+    if invalid.any():
+        raise ValueError(f"{sop_engine.PARAM_LABELS[field]}：需為數字：{series[invalid].iloc[0]!r}")
+    return numeric.fillna(default)
+
+
+def normalize_params(df):
+    # 接受欄位名 (base_area) 或 session_state key (kp_base_area)；缺少的欄位補預設值並統一型別
+    key_to_field = {key: field for field, (key, _) in sop_engine.PARAM_FIELDS.items()}
+    df = df.rename(columns=key_to_field)
+    out = pd.DataFrame(index=df.index)
+    for field, (_, default) in sop_engine.PARAM_FIELDS.items():
+        if field not in df:
+            out[field] = default
+        elif isinstance(default, bool):
+            out[field] = _bool_column(df[field], default, field)
+        elif isinstance(default, str):
+            out[field] = df[field].fillna(default).astype(str)
+        else:
+            out[field] = _number_column(df[field], default, field)
+    return out
+
+
+def evaluate_rules_frame(df):
+    # 與 sop_engine.evaluate_rules 相同的規則，回傳每個專案一列的規則結果
+    params = normalize_params(df)
+    return pd.DataFrame(sop_engine.rule_values(params), index=params.index)
+
+
+def _signature(row):
+    return sop_engine.SopSignature(
+        is_demo_project=row.is_demo_project,
+        is_b8_needed=row.is_b8_needed,
+        is_water_plan_needed=row.is_water_plan_needed,
+        is_traffic_plan_needed=row.is_traffic_plan_needed,
+        is_struct_review_needed=row.is_struct_review_needed,
+        is_demo_review_needed=row.is_demo_review_needed,
+    )
+
+
+def _item_columns(templates):
+    # (stage, item) 欄位：依階段順序，同階段依首次出現順序
+    seen = {}
+    for sop in templates:
+        for stage, items in sop.items():
+            for item in items:
+                seen.setdefault((stage, item["item"]), None)
+    order = {stage: i for i, stage in enumerate(sop_engine.STAGE_KEYS)}
+    return sorted(seen, key=lambda col: order[col[0]])
+
+
+def required_items(df, include_checklists=False):
+    # 回傳 bool DataFrame：列 = 專案 (沿用 df 的 index)，欄 = (stage, item)
+    rules = evaluate_rules_frame(df)
+    codes = rules[SIGNATURE_RULES].astype(bool)
+    combos = codes.drop_duplicates()
+
+    templates = [sop_engine.compile_sop(_signature(row)) for row in combos.itertuples(index=False)]
+    columns = _item_columns(templates)
+    presence = [
+        {(stage, item["item"]) for stage, items in sop.items() for item in items}
+        for sop in templates
+    ]
+    matrix = pd.DataFrame(
+        [[col in present for col in columns] for present in presence],
+        index=pd.MultiIndex.from_frame(combos),
+        columns=pd.MultiIndex.from_tuples(columns, names=["stage", "item"]),
+    )
+    result = matrix.reindex(pd.MultiIndex.from_frame(codes))
+    result.index = df.index
+
+    if include_checklists:
+        is_demo = codes["is_demo_project"].to_numpy()
+        for lst in sop_engine.get_checklists():
+            for code, _, name, _, demo_only in lst:
+                result[(CHECKLIST_STAGE, f"{code} {name}")] = is_demo if demo_only else True
+    return result
+
+
+def projects_requiring(df, item):
+    # item 可為項目名稱 (如「結構外審-細部設計審查」) 或規則欄位 (如 is_water_plan_needed)
+    if item in SIGNATURE_RULES:
+        mask = evaluate_rules_frame(df)[item].astype(bool)
+    else:
+        matrix = required_items(df, include_checklists=True)
+        mask = matrix.xs(item, axis=1, level="item").any(axis=1)
+    return df.index[mask.to_numpy()]
@@ -0,0 +1,128 @@
+# --- 附件儲存 (內容定址) ---
+# 上傳檔以 1 MB 為單位邊讀邊算 SHA-256 並寫入暫存檔，完成後依雜湊改名；
+# 相同內容 (跨專案) 只存一份。檔名為 <sha256><副檔名>，分散在前兩碼的子目錄下。
+# 預設放在 app 的 static/ 下，開啟 server.enableStaticServing 後由 Streamlit 伺服器直接串流檔案，
+# 下載不經過 Python session 的記憶體；其他位置則以 mmap 讀出交給 download_button。
+# 刪除專案時 app 會一併移除不再被參照的檔案；其餘遺留檔案 (如中斷的上傳) 以 CLI 清除：
+#   python sop_blobs.py --min-age 3600   # 刪除資料庫中沒有任何附件參照、且超過 1 小時未修改的檔案
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(APP_DIR, "static")
+DEFAULT_BLOB_DIR = os.environ.get("CMAPP_BLOB_DIR", os.path.join(STATIC_DIR, "blobs"))
+CHUNK_SIZE = 1 << 20
+STATIC_MAX_SIZE = 200 << 20  # Streamlit 靜態檔服務的單檔上限
+_EXTENSION = re.compile(r"^\.[a-z0-9]{1,5}$")
+
+
+def static_url(path):
+    # 位於 app static/ 下且不超過單檔上限時回傳 Streamlit 靜態檔網址，否則 None (改用 download_button)
+    path = os.path.abspath(path)
+    if os.path.commonpath([path, STATIC_DIR]) != STATIC_DIR:
+        return None
+    try:
+        if os.path.getsize(path) > STATIC_MAX_SIZE:
+            return None
+    except OSError:
+        return None
+    return "app/static/" + os.path.relpath(path, STATIC_DIR).replace(os.sep, "/")
+
+
+class BlobStore:
+    def __init__(self, root=DEFAULT_BLOB_DIR):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        # 呼叫端在「寫入 + 記錄參照」與「刪除參照 + 移除檔案」時持有，避免刪掉剛被重新參照的檔案
+        self.lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.root, name[:2], name)
+
+    def put(self, fileobj, filename=""):
+        # 回傳 (name, size)；fileobj 只需支援 read(n)
+        ext = os.path.splitext(filename)[1].lower()
+        ext = ext if _EXTENSION.match(ext) else ""
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.root, prefix=".upload-", delete=False) as tmp:
+            try:
+                for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+        name = digest.hexdigest() + ext
+        target = self.path(name)
+        if os.path.exists(target):
+            os.unlink(tmp.name)  # 內容已存在
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp.name, target)
+        return name, size
+
+    @contextmanager
+    def open(self, name):
+        # 唯讀 mmap：由作業系統分頁載入，不把整個檔案讀進 Python 記憶體
+        with open(self.path(name), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                yield view
+
+    def read(self, name):
+        with self.open(name) as view:
+            return bytes(view)
+
+    def url(self, name):
+        return static_url(self.path(name))
+
+    def remove(self, name):
+        try:
+            os.unlink(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def collect_garbage(self, referenced, min_age=0):
+        # 刪除沒有任何附件參照的檔案；回傳刪除數。
+        # min_age (秒)：略過最近寫入的檔案，避免刪掉其他 process 剛寫入、尚未記錄參照的上傳
+        referenced = set(referenced)
+        cutoff = time.time() - min_age
+        removed = 0
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                if not filename.startswith(".") and filename not in referenced and os.path.getmtime(path) <= cutoff:
+                    os.unlink(path)
+                    removed += 1
+        return removed
+
+
+def main(argv=None):
+    import argparse
+
+    import sop_store
+
+    parser = argparse.ArgumentParser(description="刪除沒有任何附件參照的檔案")
+    parser.add_argument("--db", default=sop_store.DEFAULT_DB_PATH)
+    parser.add_argument("--blob-dir", default=DEFAULT_BLOB_DIR)
+    parser.add_argument("--min-age", type=float, default=3600, help="只刪除超過幾秒未修改的檔案")
+    args = parser.parse_args(argv)
+
+    store = sop_store.ProjectStore(args.db)
+    removed = BlobStore(args.blob_dir).collect_garbage(store.attachment_blobs(), args.min_age)
+    print(f"已刪除 {removed} 個未參照的檔案")
+
+
+if __name__ == "__main__":
+    main()
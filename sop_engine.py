@@ -0,0 +1,429 @@
+# --- SOP 規則引擎 (無 UI) ---
+# 專案參數 -> 規則判讀 -> 組裝各階段 SOP 與 NW/NS 檢查表。
+# 不依賴 Streamlit / pandas / xlsxwriter，可供背景工作與 CLI 直接呼叫。
+import functools
+import hashlib
+import itertools
+from collections import namedtuple
+from types import MappingProxyType
+
+PROJECT_TYPES = ("素地新建案", "拆除併建造執照案")
+DEMO_PROJECT_TYPE = "拆除併建造執照案"
+STAGE_KEYS = ("stage_0", "stage_1", "stage_2", "stage_3", "stage_4")
+# 模板版本 (也是 cm_app 顯示與 session 重建用的 CURRENT_VERSION)：項目改名 / 搬移階段時遞增，
+# 並在 ITEM_RENAMES 登記；各專案首次載入時遷移 (見 migrate_state)
+TEMPLATE_VERSION = 20
+
+# --- 1. 專案參數 ---
+# 欄位 -> (session_state / 資料庫使用的 key, 預設值)
+PARAM_FIELDS = {
+    "project_type": ("kp_project_type", "素地新建案"),
+    "project_budget": ("kp_budget", 0),
+    "base_area": ("kp_base_area", 0),
+    "duration_month": ("kp_duration", 12),
+    "total_area": ("kp_total_area", 0),
+    "building_height": ("kp_height", 0.0),
+    "floors_above": ("kp_floors_above", 0),
+    "excavation_depth": ("kp_excavation", 0.0),
+    "floors_below": ("kp_floors_below", 0),
+    "span_rc": ("kp_span_rc", 0.0),
+    "is_geo_sensitive": ("kp_geo_sensitive", False),
+    "is_slope_land": ("kp_slope_land", False),
+}
+PARAM_DEFAULTS = {key: default for key, default in PARAM_FIELDS.values()}
+# 側邊欄標籤 (批次匯入也接受這些欄名)
+PARAM_LABELS = {
+    "project_type": "案件類型",
+    "project_budget": "工程合約經費 (萬元)",
+    "base_area": "基地/施工面積 (m²)",
+    "duration_month": "預計工期 (月)",
+    "total_area": "總樓地板面積 (m²)",
+    "building_height": "建築高度 (m)",
+    "floors_above": "地上層數",
+    "excavation_depth": "開挖深度 (m)",
+    "floors_below": "地下層數",
+    "span_rc": "RC最大跨距(m)",
+    "is_geo_sensitive": "位於地質敏感區",
+    "is_slope_land": "位於山坡地 (結構外審判斷用)",
+}
+
+ProjectParams = namedtuple("ProjectParams", list(PARAM_FIELDS), defaults=[d for _, d in PARAM_FIELDS.values()])
+
+def params_from_state(state):
+    # state：session_state 或資料庫載入的 dict (kp_* key)
+    return ProjectParams(**{field: state.get(key, default) for field, (key, default) in PARAM_FIELDS.items()})
+
+# --- 2. 規則判讀 ---
+SopRules = namedtuple("SopRules", [
+    "is_demo_project", "pollution_value", "is_water_plan_needed", "is_b8_needed",
+    "is_traffic_plan_needed", "is_struct_review_needed", "is_demo_review_needed",
+])
+
+def rule_values(p):
+    # 規則以 & / | 撰寫：p 可以是單一專案 (ProjectParams) 或整批專案的 DataFrame 欄位，
+    # 批次評估 (sop_batch) 與單一專案共用同一套門檻
+    is_demo_project = (p.project_type == DEMO_PROJECT_TYPE)
+    pollution_value = p.base_area * p.duration_month
+    return {
+        "is_demo_project": is_demo_project,
+        "pollution_value": pollution_value,
+        "is_water_plan_needed": pollution_value >= 4600,
+        "is_b8_needed": (p.base_area >= 500) | (p.project_budget >= 500),
+        "is_traffic_plan_needed": p.total_area > 10000,
+        "is_struct_review_needed": (
+            (p.building_height > 50) |
+            (p.floors_above > 15) |
+            (p.excavation_depth > 12) |
+            (p.floors_below > 3) |
+            (p.span_rc > 12) |
+            p.is_slope_land |
+            (p.is_geo_sensitive & ((p.excavation_depth > 7) | (p.floors_below > 1)))
+        ),
+        "is_demo_review_needed": is_demo_project & (p.floors_above > 10),
+    }
+
+def evaluate_rules(p):
+    values = rule_values(p)
+    return SopRules(**{
+        name: value if name == "pollution_value" else bool(value)
+        for name, value in values.items()
+    })
+
+# --- 3. 特殊狀態 Flag 與詳細文字 ---
+SPECIAL_FLAGS = (
+    "flag_slope", "flag_public", "flag_expired",
+    "flag_change", "flag_existing", "flag_demo_included",
+    "flag_demo_dihua", "flag_demo_old", "flag_demo_done", "flag_demo_shelter",
+)
+
+def get_air_pollution_context(flags):
+    doc_details = []
+    if flags.get("flag_slope"): doc_details.append("★ **山坡地基地**：\n   需檢附合約之「封面、條款、甲乙方、總價金額、用印欄頁及工程項次明細表」等影本 (需全部業主用章)。")
+    if flags.get("flag_public"): doc_details.append("★ **工程契約型(公務)**：\n   1. 工程契約書影本 (含封面、契約價金之給付條款總價頁、甲乙雙人用印頁、工程總表及明細表、決標記錄影本)。\n   2. 業務主管機關之開工證明「正本」。(均需用起造人大小章)。")
+    else: doc_details.append("★ **一般案件**：\n   需檢附合約影本 (含封面、條款、甲乙方、總價金額、用印欄頁)。")
+    if flags.get("flag_expired"): doc_details.append("★ **領照逾6個月**：\n   應檢附「開工展期申請書」影本 (全部業主大小章)。")
+    if flags.get("flag_change"): doc_details.append("★ **變更過起造人/承造人**：\n   應檢附「變更申請書」影本 (全部業主大小章)。")
+    if flags.get("flag_existing"): doc_details.append("★ **基地已有建物**：\n   請加附「建築執照申請書」及「建物概要表」影本 (全部業主大小章)。")
+    if flags.get("flag_demo_included"): doc_details.append("★ **屬建照列管拆照者**：\n   檢附「拆照影本」及「拆照空污費繳費單」影本 (全部業主大小章)。")
+    return "\n\n".join(doc_details)
+
+def get_demolition_context(flags):
+    notes = []
+    notes.append("★ **鄰房鑑定**：需取得公會函件及結論報告。")
+    if flags.get("flag_demo_dihua"): notes.append("   ⚠️ **迪化街區**：強制辦理現況鑑定。")
+    if flags.get("flag_demo_old"): notes.append("   ⚠️ **老舊建物**：需增加安全及補強評估報告。")
+    
+    notes.append("★ **廢棄物處理 (B5/B8)**：")
+    if flags.get("flag_demo_done"):
+        notes.append("   ⚠️ **先行拆除完成**：若無 B5 土方，數量應修正為「0」。")
+    else:
+        notes.append("   1. **土石方 (B5)**：向「建管處施工科」申請。\n   2. **混合物 (B8)**：向「環保局」申辦審查。")
+    
+    notes.append(f"★ **逕流廢水 (二科)**：\n   拆除面積 × 工期 (月) ≥ 4600 者需辦理。")
+    if flags.get("flag_demo_shelter"): notes.append("★ **防空避難**：\n   需函知警察分局辦理撤管。")
+    return "\n\n".join(notes)
+
+# --- 4. 核心 SOP 資料庫 (依專案類型組裝) ---
+def generate_key(stage, item_name):
+    # 產生穩定唯一的 Key
+    return hashlib.md5(f"{stage}_{item_name}".encode()).hexdigest()[:10]
+
+# 模板只依少數參數組合 (SopSignature) 變化：每種組合只組裝一次並編譯成不可變結構，
+# 同時預先算好 chk_/note_ key，之後取用不再重建 dict 或計算 MD5。
+# 警語中的數值 (面積 × 工期) 不列入組合，顯示 / 匯出時才以 critical_text 代入。
+POLLUTION_VALUE_FIELD = "{pollution_value}"
+
+SopSignature = namedtuple("SopSignature", [
+    "is_demo_project", "is_b8_needed", "is_water_plan_needed",
+    "is_traffic_plan_needed", "is_struct_review_needed", "is_demo_review_needed",
+])
+
+def _build_sop_stages(sig):
+    is_demo_project = sig.is_demo_project
+    # 警語
+    b8_msg = "⚠️ 需辦理 B8 列管 (面積>500m² 或 經費>500萬)" if sig.is_b8_needed else ""
+    water_msg = f"⚠️ 數值 {POLLUTION_VALUE_FIELD} (達4600) 需辦理" if sig.is_water_plan_needed else "✅ 免辦理"
+    traffic_msg = "⚠️ 強制辦理 (面積>10000m²)" if sig.is_traffic_plan_needed else ""
+    struct_msg = "⚠️ 符合外審條件：需辦理細部設計審查" if sig.is_struct_review_needed else ""
+    demo_msg = "⚠️ 拆除規模>10層：需辦理拆除計畫外審" if sig.is_demo_review_needed else ""
+
+    # --- 1. 定義基礎項目 (通用) ---
+    s0 = [
+        {"item": "建築執照申請作業", "dept": "建築師/建管處", "method": "線上", "timing": "【掛號階段】", "docs": "1. 申請書電子檔\n2. 書圖文件", "critical": "", "details": "透過無紙化審查系統上傳。"},
+        {"item": "領取建造執照", "dept": "建管處", "method": "臨櫃", "timing": "【校對完成後】", "docs": "1. 規費收據", "critical": "", "details": "繳納規費後領取紙本執照。"}
+    ]
+    
+    s1 = [
+        {"item": "空氣污染防制費申報", "dept": "環保局(空噪科)", "method": "線上", "timing": "【開工前】", "docs": "基本：申報書、建照影本", "critical": b8_msg, "details": "DYNAMIC_AP_CONTENT"},
+        {"item": "開工前置-逕流廢水削減計畫", "dept": "環保局(二科)", "method": "線上", "timing": "【開工前】", "docs": "1. 削減計畫書\n2. 沉沙池圖說", "critical": water_msg, "details": "辦理標準：面積 × 工期 ≥ 4600。\n環評基地需先經公會審查。"},
+        {"item": "開工申報 (正式掛號)", "dept": "建管處", "method": "線上", "timing": "【建照後6個月內】", "docs": "⚠️ 確認 NW 開工文件備齊", "critical": "⚠️ 線上掛號後 1 日內需親送正本核對", "details": "需使用 HICOS 憑證元件。"}
+    ]
+    
+    # --- 2. 定義拆除專用項目 ---
+    s1_demo = [
+        {"item": "拆除作業前置 (拆併建專用)", "dept": "相關單位", "method": "混合", "timing": "【開工前】", "docs": "鄰房鑑定、B5/B8核准函", "critical": "⚠️ 拆除案必辦", "details": "DYNAMIC_DEMO_CONTENT"},
+        {"item": "建照科行政驗收抽查", "dept": "建管處", "method": "臨櫃", "timing": "【開工申報前】", "docs": "1. 抽查紀錄表", "critical": "⚠️ 關鍵門檻", "details": "單一拆照或拆併建照案必辦。"},
+        {"item": "撤管防空避難設備", "dept": "警察分局", "method": "紙本", "timing": "【開工前】", "docs": "1. 函知公文", "critical": "", "details": "取得掛件收文戳章。"},
+    ]
+    if sig.is_demo_review_needed:
+        s1_demo.append({"item": "拆除計畫外審", "dept": "相關公會", "method": "會議", "timing": "【開工前】", "docs": "1. 拆除計畫書", "critical": demo_msg, "details": "地上10層以上拆除必辦。"})
+
+    # --- 3. 組裝 Stage 1 (開工) ---
+    # 如果是拆除案，將拆除項目插入到 "開工申報" 之前
+    final_s1 = []
+    if is_demo_project:
+        # 順序：空污 -> 拆除前置 -> 行政驗收 -> 撤管 -> 廢水 -> (外審) -> 開工
+        final_s1.append(s1[0]) # 空污
+        final_s1.extend(s1_demo) # 拆除相關
+        final_s1.append(s1[1]) # 廢水
+        final_s1.append(s1[2]) # 開工
+    else:
+        # 素地案：空污 -> 廢水 -> 開工
+        final_s1 = s1
+
+    # --- 4. 施工計畫 ---
+    s2 = []
+    if sig.is_struct_review_needed:
+        s2.append({"item": "結構外審-細部設計審查", "dept": "結構公會", "method": "會議", "timing": "【放樣前】", "docs": "細部配筋圖、核備函", "critical": struct_msg, "details": "需取得建照科核備。"})
+        s2.append({"item": "施工計畫說明會 (外審)", "dept": "相關公會", "method": "會議", "timing": "【核定前】", "docs": "施工計畫書、簡報", "critical": struct_msg, "details": "深開挖/高樓層/大跨距。"})
+    
+    if sig.is_traffic_plan_needed:
+        s2.append({"item": "交通維持計畫", "dept": "交通局", "method": "紙本", "timing": "【施工計畫前】", "docs": "交維計畫書", "critical": traffic_msg, "details": "樓地板>10000m²。"})
+        
+    s2.append({"item": "施工計畫書核備 (上傳)", "dept": "建管處", "method": "線上", "timing": "【放樣前】", "docs": "⚠️ 確認 NW 文件備齊", "critical": "", "details": "掃描 A3(圖說)/A4 PDF。配筋圖需公會用印。"})
+    
+    if is_demo_project:
+        s2.append({"item": "舊屋拆除與廢棄物結案", "dept": "環保局", "method": "線上", "timing": "【拆除後】", "docs": "結案申報書", "critical": "⚠️ B5/B8 未結案，無法放樣", "details": "拆除完成後需解除列管。"})
+
+    # --- 5. 導溝 & 放樣 ---
+    s3 = [{"item": "導溝勘驗申報", "dept": "建管處", "method": "線上", "timing": "【施工前2日】", "docs": "申請書、照片", "critical": "", "details": ""}]
+    
+    s4 = [
+        {"item": "放樣前置-用水/電/汙水核備", "dept": "自來水/台電", "method": "紙本", "timing": "【放樣前】", "docs": "核備公函", "critical": "", "details": "5樓/5戶/2000m²以下免辦。"},
+        {"item": "放樣勘驗申報", "dept": "建管處", "method": "線上", "timing": "【結構施工前】", "docs": "⚠️ 確認 NS 文件備齊", "critical": "⚠️ 現場不得先行施工", "details": "網路核備後，送紙本掛件。"}
+    ]
+    if is_demo_project:
+        # 拆除案在放樣前要加地界複丈
+        s4.insert(1, {"item": "地界複丈/路心樁復原", "dept": "地政", "method": "臨櫃", "timing": "【拆除後】", "docs": "複丈申請書", "critical": "", "details": "拆除後重測地界。"})
+
+    # 回傳組裝好的資料
+    return {
+        "stage_0": s0,
+        "stage_1": final_s1,
+        "stage_2": s2,
+        "stage_3": s3,
+        "stage_4": s4
+    }
+
+def _compile_item(stage, item):
+    key = generate_key(stage, item['item'])
+    return MappingProxyType({**item, "key": key, "chk_key": f"chk_{key}", "note_key": f"note_{key}"})
+
+@functools.lru_cache(maxsize=64)
+def compile_sop(sig):
+    stages = _build_sop_stages(sig)
+    return MappingProxyType({
+        stage: tuple(_compile_item(stage, item) for item in items)
+        for stage, items in stages.items()
+    })
+
+def all_template_items():
+    # 各種專案組合下可能出現的所有 SOP 項目：{chk_key: (stage, 已編譯項目)}
+    return dict(_all_template_items())
+
+@functools.lru_cache(maxsize=1)
+def _all_template_items():
+    seen = {}
+    for values in itertools.product((False, True), repeat=len(SopSignature._fields)):
+        for stage, items in _build_sop_stages(SopSignature(*values)).items():
+            for item in items:
+                compiled = _compile_item(stage, item)
+                seen.setdefault(compiled["chk_key"], (stage, compiled))
+    return tuple(seen.items())
+
+def sop_signature(rules):
+    return SopSignature(
+        is_demo_project=rules.is_demo_project,
+        is_b8_needed=rules.is_b8_needed,
+        is_water_plan_needed=rules.is_water_plan_needed,
+        is_traffic_plan_needed=rules.is_traffic_plan_needed,
+        is_struct_review_needed=rules.is_struct_review_needed,
+        is_demo_review_needed=rules.is_demo_review_needed,
+    )
+
+def critical_text(item, rules):
+    # 代入專案自己的警語數值 (畫面與 Excel 匯出共用)
+    return item["critical"].replace(POLLUTION_VALUE_FIELD, f"{rules.pollution_value}")
+
+def get_sop(params):
+    # 專案參數 -> 已編譯 (唯讀) 的各階段 SOP
+    return compile_sop(sop_signature(evaluate_rules(params)))
+
+# --- 5. NW/NS 檢查表 ---
+@functools.lru_cache(maxsize=None)
+def get_checklists():
+    # 完整清單 (含拆除專用)，依專案類型過濾請用 applicable_checklists
+    # (為了節省篇幅，這裡使用 V19.0 的完整清單)
+    list_start = (
+        ("NW0100", "開工", "建築工程開工申報書", "", False), ("NW0500", "開工", "建築執照正本", "", False),
+        ("NW1000", "開工", "空污費收據", "", False), ("NW1100", "開工", "逕流廢水核備", "", False),
+        ("NW2400", "開工", "拆除施工計畫書", "", True), ("NW2500", "開工", "監拆報告書", "", True),
+        ("NW2600", "開工", "拆除B5備查", "", True), ("NW2700", "開工", "拆除B8備查", "", True),
+        ("NW2900", "開工", "塔吊檢查表", "無則附切結", False)
+    )
+    list_plan = (
+        ("NW3300", "計畫", "施工計畫書", "", False), ("NW5000", "計畫", "配筋圖(A3)", "公會用印", False),
+        ("NW5300", "計畫", "交維計畫核准", "1萬m²以上", False), ("NW5700", "計畫", "觀測系統", "深開挖", False)
+    )
+    list_ns = (
+        ("NS0100", "放樣", "勘驗申報書", "", False), ("NS0900", "放樣", "現場照片", "", False),
+        ("NS1100", "放樣", "鋼筋保證書", "", False), ("NS2100", "放樣", "放樣切結書", "", False)
+    )
+    return list_start, list_plan, list_ns
+
+def applicable_checklists(is_demo_project):
+    # 素地案不列拆除專用文件
+    return tuple(
+        tuple(row for row in lst if is_demo_project or not row[4])
+        for lst in get_checklists()
+    )
+
+def checklist_key(code, cat):
+    return f"chk_{code}_{cat}"
+
+# --- 6. 進度彙總範圍 ---
+# 儀表板的統計範圍：五個階段 + 三份檢查表 (順序同 get_checklists)
+CHECKLIST_SCOPES = ("nw_start", "nw_plan", "ns")
+SCOPE_LABELS = {
+    "stage_0": "0.建照領取", "stage_1": "1.開工申報", "stage_2": "2.施工計畫",
+    "stage_3": "3.導溝勘驗", "stage_4": "4.放樣勘驗",
+    "nw_start": "NW 開工文件", "nw_plan": "NW 計畫文件", "ns": "NS 放樣文件",
+}
+
+# 階段解鎖依賴 (DAG)：階段 -> 直接前置節點。前置節點可以是階段、檢查表範圍 (如 "nw_start")
+# 或單一 chk key (如 checklist_key("NW3300", "計畫"))；解鎖需所有遞移前置節點皆完成
+STAGE_DEPENDENCIES = {
+    "stage_0": (),
+    "stage_1": ("stage_0",),
+    "stage_2": ("stage_1",),
+    "stage_3": ("stage_2",),
+    "stage_4": ("stage_2",),
+}
+
+def progress_scopes(params):
+    # 回傳 (fingerprint, {scope: ((chk_key, label), ...)})；fingerprint 代表項目組成，組成不變就不必重建彙總
+    rules = evaluate_rules(params)
+    scopes = {
+        stage: tuple((item["chk_key"], item["item"]) for item in items)
+        for stage, items in get_sop(params).items()
+    }
+    for scope, lst in zip(CHECKLIST_SCOPES, applicable_checklists(rules.is_demo_project)):
+        scopes[scope] = tuple((checklist_key(code, cat), f"{code} {name}") for code, cat, name, _, _ in lst)
+    fingerprint = hashlib.md5(
+        "|".join(f"{scope}:{key}" for scope, entries in scopes.items() for key, _ in entries).encode()
+    ).hexdigest()
+    return fingerprint, scopes
+
+def backfill_progress(store):
+    # 補建從未開啟過的專案的進度彙總 (儀表板與全文檢索共用)；回傳補建的專案數
+    missing = store.projects_without_progress()
+    for project_id in missing:
+        params = params_from_state(store.load_state(project_id))
+        store.sync_progress(project_id, *progress_scopes(params))
+    return len(missing)
+
+# --- 7. 模板版本遷移 ---
+# 項目 key 由 generate_key(stage, 項目名稱) 產生：項目搬到其他階段或改名時 key 會變。
+# 搬移階段可自動對應 (以各階段 + 現有名稱重算舊 key)；改名需登記在下列對照表。
+ITEM_RENAMES = {
+    # (舊 stage, 舊名稱): 新名稱
+}
+CHECKLIST_RENAMES = {
+    # 舊 chk key: 新 chk key (如檢查表代碼調整)
+}
+
+def key_migrations():
+    # 舊項目 key (不含 chk_/note_ 前綴) -> 目前模板的 key
+    current = {}
+    for chk_key, (stage, item) in all_template_items().items():
+        current.setdefault(item["item"], []).append(item["key"])
+    mapping = {}
+    for name, keys in current.items():
+        if len(keys) != 1:
+            continue  # 同名項目出現在多個階段，無法判斷
+        for stage in STAGE_KEYS:
+            old = generate_key(stage, name)
+            if old != keys[0]:
+                mapping[old] = keys[0]
+    for (old_stage, old_name), new_name in ITEM_RENAMES.items():
+        if len(current.get(new_name, ())) == 1:
+            mapping[generate_key(old_stage, old_name)] = current[new_name][0]
+    return mapping
+
+def key_renames():
+    # 含 chk_/note_ 前綴的完整對照 (舊 key -> 目前 key)
+    renames = {
+        f"{prefix}{old}": f"{prefix}{new}" for old, new in key_migrations().items() for prefix in ("chk_", "note_")
+    }
+    renames.update(CHECKLIST_RENAMES)
+    return renames
+
+def migrate_state(state, renames=None):
+    # 回傳 (changes, deleted)：把舊 key 的勾選 / 備註搬到目前模板的 key；
+    # 新 key 已有內容 (已勾選 / 已填備註) 時保留新值，舊 key 一律移除
+    changes, deleted = {}, set()
+    for old, new in (renames or key_renames()).items():
+        if old not in state:
+            continue
+        deleted.add(old)
+        if state[old] and not state.get(new):
+            changes[new] = state[old]
+    return changes, deleted
+
+def ensure_migrated(store, project_id):
+    # 專案首次以新模板版本載入時遷移一次 (之後 template_version 相同即略過)
+    if store.template_version(project_id) == TEMPLATE_VERSION:
+        return False
+    renames = key_renames()
+    changes, deleted = migrate_state(store.load_state(project_id), renames)
+    # 附件以 chk key 掛在項目下，與狀態在同一交易內改掛到新 key；
+    # 狀態沒有變動時只更新模板版本，不產生新版本 (其他 session 不必重新同步)
+    attachment_renames = {old: new for old, new in renames.items() if old.startswith("chk_")}
+    if changes or deleted:
+        store.apply_changes(
+            project_id, changes, deleted, template_version=TEMPLATE_VERSION, attachment_renames=attachment_renames
+        )
+    else:
+        store.set_template_version(project_id, TEMPLATE_VERSION, attachment_renames)
+    return True
+
+# --- 8. CLI ---
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="依專案參數產生 SOP (JSON)")
+    for field, (_, default) in PARAM_FIELDS.items():
+        flag = "--" + field.replace("_", "-")
+        if isinstance(default, bool):
+            parser.add_argument(flag, action="store_true")
+        elif field == "project_type":
+            parser.add_argument(flag, choices=PROJECT_TYPES, default=default)
+        else:
+            parser.add_argument(flag, type=type(default), default=default)
+    args = parser.parse_args(argv)
+
+    params = ProjectParams(**{field: getattr(args, field) for field in PARAM_FIELDS})
+    rules = evaluate_rules(params)
+    result = {
+        "rules": rules._asdict(),
+        "stages": {stage: [dict(item) for item in items] for stage, items in get_sop(params).items()},
+        "checklists": [
+            [{"code": code, "cat": cat, "name": name, "note": note} for code, cat, name, note, _ in lst]
+            for lst in applicable_checklists(rules.is_demo_project)
+        ],
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
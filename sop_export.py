@@ -0,0 +1,110 @@
+# --- Excel 匯出子系統 ---
+# 工作簿只在按下下載時才產生，並以「SOP 內容 + 勾選/備註狀態」的雜湊快取。
+# 各階段的資料表另外依階段雜湊快取，狀態變動時只重建有變動的階段。
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import sop_engine
+
+SHEET_NAME = "SOP流程"
+STAGE_COLUMN = "階段代號"
+# 編譯後模板附帶的內部欄位 (預先算好的 key)，不輸出到 Excel
+_INTERNAL_FIELDS = ("done", "note", "key", "chk_key", "note_key")
+
+_MAX_WORKBOOKS = 16
+_MAX_STAGE_FRAMES = 256
+
+_lock = threading.Lock()
+_workbook_cache = OrderedDict()   # 總雜湊 -> xlsx bytes
+_stage_frame_cache = OrderedDict()  # 階段雜湊 -> DataFrame
+
+
+def _cache_get(cache, key):
+    with _lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+
+def _cache_put(cache, key, value, limit):
+    with _lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+
+def clear_cache():
+    with _lock:
+        _workbook_cache.clear()
+        _stage_frame_cache.clear()
+
+
+def _stage_digest(stage, items, progress, criticals):
+    # 階段內容 + 狀態的雜湊；警語數值 (criticals) 不同也會反映在雜湊上
+    payload = json.dumps(
+        [stage, [dict(item) for item in items], progress, criticals],
+        ensure_ascii=False, sort_keys=True, default=str,
+    )
+    return hashlib.md5(payload.encode()).hexdigest()
+
+
+def _build_stage_frame(stage, items, progress, criticals):
+    rows = []
+    for item, (done, note), critical in zip(items, progress, criticals):
+        row = {k: v for k, v in item.items() if k not in _INTERNAL_FIELDS}
+        row["critical"] = critical
+        row["done"] = done
+        row["note"] = note
+        row[STAGE_COLUMN] = stage
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def stage_frame(stage, items, progress, rules):
+    criticals = [sop_engine.critical_text(item, rules) for item in items]
+    digest = _stage_digest(stage, items, progress, criticals)
+    frame = _cache_get(_stage_frame_cache, digest)
+    if frame is None:
+        frame = _build_stage_frame(stage, items, progress, criticals)
+        _cache_put(_stage_frame_cache, digest, frame, _MAX_STAGE_FRAMES)
+    return digest, frame
+
+
+def progress_from_state(sop_data, state):
+    # 由已存的專案狀態 (如 ProjectStore.load_state) 組出 workbook_bytes 需要的 progress
+    return {
+        stage: [(bool(state.get(item["chk_key"], False)), state.get(item["note_key"], "")) for item in items]
+        for stage, items in sop_data.items()
+    }
+
+
+def workbook_bytes(sop_data, progress, rules):
+    # sop_data: {stage: [item, ...]}
+    # progress: {stage: [(done, note), ...]}，順序與 sop_data 內項目一致
+    # rules: sop_engine.SopRules，代入警語數值
+    digests, frames = [], []
+    for stage, items in sop_data.items():
+        digest, frame = stage_frame(stage, items, list(progress.get(stage, ())), rules)
+        digests.append(digest)
+        if not frame.empty:
+            frames.append(frame)
+
+    book_key = hashlib.md5("|".join(digests).encode()).hexdigest()
+    data = _cache_get(_workbook_cache, book_key)
+    if data is not None:
+        return data
+
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+        if frames:
+            pd.concat(frames, ignore_index=True).to_excel(writer, index=False, sheet_name=SHEET_NAME)
+    data = buffer.getvalue()
+    _cache_put(_workbook_cache, book_key, data, _MAX_WORKBOOKS)
+    return data
@@ -0,0 +1,202 @@
+# --- 批次匯入專案參數 (.xlsx / .csv) ---
+# 以串流方式逐列讀取 (openpyxl read-only / csv)，依側邊欄相同欄位驗證，
+# 每累積一批才寫入資料庫；格式錯誤的列記入錯誤報告，不中斷整批匯入。
+# UI 以 ImportJob 在背景執行緒匯入，只輪詢計數 (同 sop_jobs 的匯出工作)。
+import csv
+import io
+import threading
+from collections import namedtuple
+
+import sop_engine
+
+NAME_HEADERS = ("專案名稱", "name", "project_name")
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+# 是/否欄位接受的文字 (不分大小寫)；sop_batch 的 DataFrame 評估共用同一組
+TRUE_TEXT = {"1", "true", "t", "yes", "y", "是", "v", "✓"}
+FALSE_TEXT = {"", "0", "false", "f", "no", "n", "否", "x"}
+
+ImportReport = namedtuple("ImportReport", ["imported", "error_count", "errors"])
+
+
+def _header_map():
+    # 欄名 (欄位名 / kp_ key / 側邊欄標籤) -> 欄位
+    mapping = {h: "name" for h in NAME_HEADERS}
+    for field, (key, _) in sop_engine.PARAM_FIELDS.items():
+        mapping[field] = field
+        mapping[key] = field
+        mapping[sop_engine.PARAM_LABELS[field]] = field
+    return mapping
+
+
+def iter_rows(fileobj, filename):
+    # 逐列產生 (列號, tuple)，列號從 1 起算 (含標題列)
+    if filename.lower().endswith(".csv"):
+        text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+        try:
+            yield from enumerate(csv.reader(text), start=1)
+        finally:
+            text.detach()
+        return
+
+    from openpyxl import load_workbook
+
+    wb = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from enumerate(wb.active.iter_rows(values_only=True), start=1)
+    finally:
+        wb.close()
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in TRUE_TEXT:
+        return True
+    if text in FALSE_TEXT:
+        return False
+    raise ValueError(f"無法判讀為是/否：{value!r}")
+
+
+def _parse_number(value, kind):
+    if isinstance(value, str):
+        value = value.strip().replace(",", "")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"需為數字：{value!r}") from None
+    if number < 0:
+        raise ValueError(f"不得為負數：{value!r}")
+    if kind is int:
+        if not number.is_integer():
+            raise ValueError(f"需為整數：{value!r}")
+        return int(number)
+    return number
+
+
+def parse_row(values):
+    # values：{欄位: 原始值}。回傳 (專案名稱, {kp_key: 值})，格式錯誤時拋出 ValueError
+    name = values.get("name")
+    name = "" if name is None else str(name).strip()
+    if not name:
+        raise ValueError("缺少專案名稱")
+
+    state = {}
+    problems = []
+    for field, (key, default) in sop_engine.PARAM_FIELDS.items():
+        raw = values.get(field)
+        if raw is None or (isinstance(raw, str) and not raw.strip()):
+            state[key] = default
+            continue
+        try:
+            if field == "project_type":
+                raw = str(raw).strip()
+                if raw not in sop_engine.PROJECT_TYPES:
+                    raise ValueError(f"需為 {'/'.join(sop_engine.PROJECT_TYPES)}：{raw!r}")
+                state[key] = raw
+            elif isinstance(default, bool):
+                state[key] = _parse_bool(raw)
+            else:
+                state[key] = _parse_number(raw, type(default))
+        except (TypeError, ValueError) as exc:
+            problems.append(f"{sop_engine.PARAM_LABELS[field]}：{exc}")
+    if problems:
+        raise ValueError("；".join(problems))
+    return name, state
+
+
+def import_projects(store, fileobj, filename, chunk_size=CHUNK_SIZE, on_progress=None):
+    rows = iter_rows(fileobj, filename)
+    header_map = _header_map()
+    errors = []
+    error_count = 0
+    imported = 0
+
+    def add_error(row_no, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"列": row_no, "錯誤": message})
+
+    def flush(chunk):
+        nonlocal imported
+        entries = [
+            (name, state, sop_engine.progress_scopes(sop_engine.params_from_state(state)))
+            for _, name, state in chunk
+        ]
+        for row_no, created in zip((r for r, _, _ in chunk), store.create_projects(entries, template_version=sop_engine.TEMPLATE_VERSION)):
+            if created is None:
+                add_error(row_no, "專案名稱已存在")
+            else:
+                imported += 1
+        if on_progress:
+            on_progress(imported, error_count)
+
+    chunk = []
+    row_no = 1
+    try:
+        header = next(rows, None)
+        if header is None:
+            return ImportReport(0, 1, [{"列": 1, "錯誤": "檔案沒有內容"}])
+        columns = [header_map.get(str(h).strip()) if h is not None else None for h in header[1]]
+        if "name" not in columns:
+            return ImportReport(0, 1, [{"列": 1, "錯誤": f"缺少「{NAME_HEADERS[0]}」欄"}])
+
+        for row_no, row in rows:
+            if not any(v is not None and str(v).strip() for v in row):
+                continue  # 空白列
+            values = {col: v for col, v in zip(columns, row) if col}
+            try:
+                name, state = parse_row(values)
+            except ValueError as exc:
+                add_error(row_no, str(exc))
+                continue
+            chunk.append((row_no, name, state))
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    except UnicodeDecodeError:
+        # CSV 須為 UTF-8 (Excel 請另存為「CSV UTF-8」)；已讀入的批次照常寫入
+        if chunk:
+            flush(chunk)
+        add_error(row_no, "CSV 檔案編碼需為 UTF-8，此列之後未匯入")
+    finally:
+        rows.close()  # 提早結束時也要關閉活頁簿
+    errors.sort(key=lambda e: e["列"])
+    return ImportReport(imported, error_count, errors)
+
+
+class ImportJob:
+    # 建立後即在背景執行緒匯入；imported / error_count 於每批寫入後更新
+    def __init__(self, store, fileobj, filename):
+        self.filename = filename
+        self.imported = 0
+        self.error_count = 0
+        self.report = None
+        self.error = None
+        self.status = "running"  # running / done / failed
+        threading.Thread(
+            target=self._run, args=(store, fileobj, filename), name="import-job", daemon=True
+        ).start()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def _progress(self, imported, error_count):
+        self.imported, self.error_count = imported, error_count
+
+    def _run(self, store, fileobj, filename):
+        try:
+            self.report = import_projects(store, fileobj, filename, on_progress=self._progress)
+            self.imported, self.error_count = self.report.imported, self.report.error_count
+            self.status = "done"
+        except Exception as exc:  # 檔案損毀等：已寫入的批次保留，回報錯誤
+            self.error = str(exc) or type(exc).__name__
+            self.status = "failed"
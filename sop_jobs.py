@@ -0,0 +1,159 @@
+# --- 批次匯出工作佇列 ---
+# 月底一次產生多個專案的 SOP 工作簿：背景執行緒從資料庫讀出各專案狀態，
+# 交給 process pool 以 sop_export.workbook_bytes (與主畫面下載相同的 DataFrame -> xlsxwriter 路徑) 產生，
+# 完成一個就寫進磁碟上的 zip，不把整批檔案留在記憶體。UI 只輪詢工作的計數。
+# zip 預設放在 app 的 static/exports 下，由 Streamlit 靜態檔服務直接串流下載 (同 sop_blobs)。
+import io
+import itertools
+import multiprocessing
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+import sop_blobs
+import sop_engine
+import sop_export
+
+DEFAULT_EXPORT_DIR = os.environ.get("CMAPP_EXPORT_DIR", os.path.join(sop_blobs.STATIC_DIR, "exports"))
+SUMMARY_NAME = "進度彙總.xlsx"
+_UNSAFE_NAME = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+def render_project(project_id, name, state):
+    # 在 worker process 執行：回傳 (專案 id, 名稱, xlsx bytes, 彙總列)
+    params = sop_engine.params_from_state(state)
+    rules = sop_engine.evaluate_rules(params)
+    sop_data = sop_engine.get_sop(params)
+    progress = sop_export.progress_from_state(sop_data, state)
+    summary = {"專案": name, "案件類型": params.project_type}
+    for stage, entries in progress.items():
+        summary[sop_engine.SCOPE_LABELS[stage]] = f"{sum(done for done, _ in entries)}/{len(entries)}"
+    return project_id, name, sop_export.workbook_bytes(sop_data, progress, rules), summary
+
+
+def _summary_bytes(rows):
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+        pd.DataFrame(rows).to_excel(writer, index=False, sheet_name="彙總")
+    return buffer.getvalue()
+
+
+class ExportJob:
+    def __init__(self, job_id, projects, path):
+        self.id = job_id
+        self.projects = projects  # [(project_id, name), ...]
+        self.path = path
+        self.total = len(projects)
+        self.done = 0
+        self.errors = []  # [(專案名稱, 錯誤訊息), ...]
+        self.status = "queued"  # queued / running / done / failed / cancelled
+        self.created_at = time.time()
+        self.finished_at = None
+        self._cancel = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def cancel(self):
+        self._cancel.set()
+
+
+class ExportQueue:
+    # 整個 process 共用 (st.cache_resource)；worker 數預設為 CPU 核心數
+    def __init__(self, store, export_dir=DEFAULT_EXPORT_DIR, max_workers=None):
+        self.store = store
+        self.export_dir = export_dir
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._executor = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn：Streamlit 為多執行緒 process，fork 可能複製到被持有的 lock
+                self._executor = ProcessPoolExecutor(
+                    self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _discard_pool(self, pool):
+        # worker 異常結束 (OOM / kill) 後 pool 無法再用：丟棄，下一個工作重建
+        with self._lock:
+            if self._executor is pool:
+                self._executor = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, project_ids):
+        names = dict(self.store.list_projects())
+        projects = [(pid, names[pid]) for pid in project_ids if pid in names]
+        os.makedirs(self.export_dir, exist_ok=True)
+        with self._lock:
+            job_id = next(self._ids)
+            path = os.path.join(self.export_dir, f"SOP_批次匯出_{time.strftime('%Y%m%d_%H%M%S')}_{job_id}.zip")
+            job = self._jobs[job_id] = ExportJob(job_id, projects, path)
+        threading.Thread(target=self._run, args=(job,), name=f"export-job-{job_id}", daemon=True).start()
+        return job
+
+    def jobs(self):
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.id, reverse=True)
+
+    def _run(self, job):
+        job.status = "running"
+        pool = self._pool()
+        pending = iter(job.projects)
+        in_flight = {}
+        summary = []
+        try:
+            with zipfile.ZipFile(job.path, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+                while True:
+                    # 同時送出的工作量限制在 worker 數兩倍，狀態讀取與壓縮寫入不會一次堆滿記憶體
+                    while not job._cancel.is_set() and len(in_flight) < self.max_workers * 2:
+                        project = next(pending, None)
+                        if project is None:
+                            break
+                        sop_engine.ensure_migrated(self.store, project[0])
+                        state = self.store.load_state(project[0])
+                        in_flight[pool.submit(render_project, project[0], project[1], state)] = project
+                    if not in_flight:
+                        break
+                    completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        project_id, name = in_flight.pop(future)
+                        try:
+                            _, _, data, row = future.result()
+                        except BrokenProcessPool:
+                            raise
+                        except Exception as exc:  # 單一專案失敗不中斷整批
+                            job.errors.append((name, f"{type(exc).__name__}: {exc}"))
+                        else:
+                            bundle.writestr(f"{project_id:05d}_{_UNSAFE_NAME.sub('_', name)}.xlsx", data)
+                            summary.append(row)
+                        job.done += 1
+                if summary:
+                    bundle.writestr(SUMMARY_NAME, _summary_bytes(summary))
+            job.status = "cancelled" if job._cancel.is_set() else "done"
+        except BrokenProcessPool as exc:
+            self._discard_pool(pool)
+            job.errors.append(("", f"worker process 異常結束：{exc}"))
+            job.status = "failed"
+        except Exception as exc:
+            job.errors.append(("", f"{type(exc).__name__}: {exc}"))
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
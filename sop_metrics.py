@@ -0,0 +1,143 @@
+# --- 效能量測 ---
+# 各主要區段以 span 計時；每次 rerun (整頁或片段) 彙整成一筆紀錄，
+# 保留滾動視窗計算百分位數，並可輸出 JSONL 或 Prometheus textfile 供維運追蹤。
+#   CMAPP_METRICS_JSONL=/var/log/cmapp/metrics.jsonl   每次 rerun 附加一行
+#   CMAPP_METRICS_PROM=/var/lib/node_exporter/cmapp.prom  定期覆寫 (node_exporter textfile collector)
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+WINDOW_SIZE = 500
+PROM_WRITE_INTERVAL = 5.0  # 秒
+QUANTILES = (0.5, 0.95, 0.99)
+RUN_SPAN = "rerun"
+
+
+def percentile(sorted_values, q):
+    # nearest-rank
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class MetricsRecorder:
+    def __init__(self, jsonl_path=None, prom_path=None, window=WINDOW_SIZE):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self._lock = threading.Lock()
+        self._windows = defaultdict(lambda: deque(maxlen=window))  # (page, span) -> 最近 ms
+        self._totals = defaultdict(lambda: [0, 0.0])  # (page, span) -> [count, sum_ms] (累計，Prometheus 用)
+        self._last_prom_write = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get("CMAPP_METRICS_JSONL"), os.environ.get("CMAPP_METRICS_PROM"))
+
+    def record_run(self, page, kind, total_ms, spans):
+        # kind："full" 整頁 rerun；"partial" 片段重跑、widget callback 等單一區段
+        entries = ((RUN_SPAN, total_ms), *spans.items()) if kind == "full" else spans.items()
+        with self._lock:
+            for name, ms in entries:
+                self._windows[(page, name)].append(ms)
+                totals = self._totals[(page, name)]
+                totals[0] += 1
+                totals[1] += ms
+            write_prom = self.prom_path and time.monotonic() - self._last_prom_write >= PROM_WRITE_INTERVAL
+            if write_prom:
+                self._last_prom_write = time.monotonic()
+        if self.jsonl_path:
+            line = json.dumps({
+                "ts": round(time.time(), 3), "page": page, "kind": kind,
+                "total_ms": round(total_ms, 3), "spans": {k: round(v, 3) for k, v in spans.items()},
+            }, ensure_ascii=False)
+            with self._lock, open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        if write_prom:
+            self.write_prometheus()
+
+    def summary(self, page=None):
+        # 各 span 的滾動百分位數 (ms)
+        with self._lock:
+            windows = {key: sorted(values) for key, values in self._windows.items() if page in (None, key[0])}
+        rows = []
+        for (pg, name), values in sorted(windows.items()):
+            row = {"page": pg, "span": name, "count": len(values)}
+            for q in QUANTILES:
+                row[f"p{int(q * 100)}_ms"] = round(percentile(values, q), 2)
+            row["max_ms"] = round(values[-1], 2)
+            rows.append(row)
+        return rows
+
+    def write_prometheus(self):
+        with self._lock:
+            windows = {key: sorted(values) for key, values in self._windows.items()}
+            totals = {key: tuple(value) for key, value in self._totals.items()}
+        lines = [
+            "# HELP cmapp_span_duration_ms Streamlit rerun / section duration in milliseconds.",
+            "# TYPE cmapp_span_duration_ms summary",
+        ]
+        for (page, name), values in sorted(windows.items()):
+            labels = f'page="{page}",span="{name}"'
+            for q in QUANTILES:
+                lines.append(f'cmapp_span_duration_ms{{{labels},quantile="{q}"}} {percentile(values, q):.3f}')
+            count, total = totals[(page, name)]
+            lines.append(f"cmapp_span_duration_ms_sum{{{labels}}} {total:.3f}")
+            lines.append(f"cmapp_span_duration_ms_count{{{labels}}} {count}")
+        # 先寫暫存檔再改名，collector 不會讀到寫一半的檔案
+        tmp_path = f"{self.prom_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prom_path)
+
+
+@functools.lru_cache(maxsize=None)
+def default_recorder():
+    # 整個 process 共用一個 recorder (各頁面、各 session)
+    return MetricsRecorder.from_env()
+
+
+class RunTimer:
+    # 一次整頁 rerun 的計時器；finish() 之後的 span 來自片段重跑或 widget callback，各自記為一筆 partial 紀錄
+    def __init__(self, page, recorder=None):
+        self.page = page
+        self.recorder = recorder or default_recorder()
+        self.spans = {}
+        self.finished = False
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            if self.finished:
+                self.recorder.record_run(self.page, "partial", ms, {name: ms})
+            else:
+                self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def finish(self):
+        total_ms = (time.perf_counter() - self._started) * 1000
+        self.finished = True
+        self.recorder.record_run(self.page, "full", total_ms, self.spans)
+        return {"total_ms": total_ms, "spans": dict(self.spans)}
+
+
+def timed(recorder, page, name, func):
+    # 包裝在 Streamlit 腳本外執行的工作 (如下載按鈕的延遲產生)
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            recorder.record_run(page, "partial", ms, {name: ms})
+    return wrapper
@@ -0,0 +1,84 @@
+# --- 階段解鎖：依賴圖 + 增量計數 ---
+# 節點為階段 / 檢查表 (或單一 chk key)，每個節點記錄「剩餘未完成項目數」。
+# 勾選變動只更新所屬節點的計數 (O(1))；節點完成與否翻轉時，才更新依賴它的階段。
+from collections import defaultdict
+
+
+def _closure(dependencies):
+    # 每個階段的遞移前置節點；同時檢查循環依賴
+    resolved = {}
+
+    def visit(node, path):
+        if node in resolved:
+            return resolved[node]
+        if node in path:
+            raise ValueError(f"階段依賴形成循環：{' -> '.join(path + (node,))}")
+        result = set()
+        for dep in dependencies.get(node, ()):
+            result.add(dep)
+            result |= visit(dep, path + (node,))
+        resolved[node] = frozenset(result)
+        return resolved[node]
+
+    for node in dependencies:
+        visit(node, ())
+    return resolved
+
+
+class ProgressTracker:
+    def __init__(self, groups, dependencies, checked=()):
+        # groups：{節點: (chk_key, ...)}，如 progress_scopes 回傳的各階段 / 檢查表
+        # dependencies：{階段: (前置節點或 chk_key, ...)}
+        # checked：已勾選的 chk_key
+        nodes = {name: tuple(keys) for name, keys in groups.items()}
+        for deps in dependencies.values():
+            for dep in deps:
+                if dep not in nodes:
+                    nodes[dep] = (dep,)  # 單一項目作為前置條件
+
+        checked = set(checked)
+        self._done = {key for keys in nodes.values() for key in keys if key in checked}
+        self._members = defaultdict(list)
+        self._remaining = {}
+        for name, keys in nodes.items():
+            for key in keys:
+                self._members[key].append(name)
+            self._remaining[name] = sum(1 for key in keys if key not in self._done)
+
+        self._dependents = defaultdict(list)
+        self._blocked = {}
+        for stage, prerequisites in _closure(dependencies).items():
+            for node in prerequisites:
+                self._dependents[node].append(stage)
+            self._blocked[stage] = sum(1 for node in prerequisites if self._remaining[node])
+        self.generation = 0  # 任一階段解鎖狀態改變時遞增，供片段判斷是否需整頁重跑
+
+    def set(self, key, done):
+        if key not in self._members or (key in self._done) == done:
+            return
+        if done:
+            self._done.add(key)
+        else:
+            self._done.discard(key)
+        step = -1 if done else 1
+        for node in self._members[key]:
+            before = self._remaining[node]
+            after = before + step
+            self._remaining[node] = after
+            if (before == 0) == (after == 0):
+                continue
+            # 節點完成狀態翻轉：更新依賴它的階段
+            for stage in self._dependents[node]:
+                was_unlocked = self._blocked[stage] == 0
+                self._blocked[stage] += step
+                if was_unlocked != (self._blocked[stage] == 0):
+                    self.generation += 1
+
+    def remaining(self, node):
+        return self._remaining.get(node, 0)
+
+    def is_complete(self, node):
+        return self._remaining.get(node, 0) == 0
+
+    def is_unlocked(self, stage):
+        return self._blocked.get(stage, 0) == 0
@@ -0,0 +1,171 @@
+# --- 期限排程 (無 UI) ---
+# 把 SOP 項目的「時機」文字 (如【建照後6個月內】、【施工前2日】、【開工前】) 解析成
+# 「以專案里程碑日期為基準的相對期限」，再依各專案填入的里程碑算出實際到期日。
+# 到期日寫入 sop_store 的 due_index (依日期排序的索引)，逾期 / 本週到期是範圍查詢，不必逐專案掃描。
+#   python sop_schedule.py --days 7      # 每日提醒：逾期與 7 天內到期的未完成項目 (JSON lines)
+import calendar
+import functools
+import hashlib
+import re
+from collections import namedtuple
+from datetime import date, timedelta
+
+# --- 1. 里程碑 ---
+# 名稱 -> 標籤；session_state / 資料庫使用 ms_<名稱> 為 key，值為 ISO 日期字串或 date
+MILESTONES = {
+    "permit": "建照核發日",
+    "start": "預定開工日",
+    "plan": "施工計畫核定日",
+    "works": "預定施工日 (導溝開挖)",
+    "setout": "預定放樣日",
+    "structure": "預定結構施工日",
+}
+MILESTONE_PREFIX = "ms_"
+EXPIRY_MONTHS = 6  # 領取建照逾 6 個月 (flag_expired)
+
+# 時機文字中的基準詞 -> 里程碑；較長的詞優先比對 (如「開工申報」先於「開工」)
+ANCHOR_ALIASES = {
+    "建照": "permit",
+    "開工申報": "start",
+    "開工": "start",
+    "施工計畫": "plan",
+    "核定": "plan",
+    "結構施工": "structure",
+    "施工": "works",
+    "放樣": "setout",
+}
+
+Deadline = namedtuple("Deadline", ["milestone", "months", "days"])
+
+_UNIT_DAYS = {"日": 1, "天": 1, "週": 7}
+_AFTER = re.compile(r"^(?P<anchor>.+?)後(?P<n>\d+)(?P<unit>個月|日|天|週)內$")
+_BEFORE = re.compile(r"^(?P<anchor>.+?)前(?:(?P<n>\d+)(?P<unit>個月|日|天|週))?$")
+
+
+def milestone_key(name):
+    return MILESTONE_PREFIX + name
+
+
+def _anchor(text):
+    for alias in sorted(ANCHOR_ALIASES, key=len, reverse=True):
+        if text == alias or text.endswith(alias):
+            return ANCHOR_ALIASES[alias]
+    return None
+
+
+def _offset(n, unit, sign):
+    n = int(n or 0) * sign
+    return (n, 0) if unit == "個月" else (0, n * _UNIT_DAYS.get(unit, 1))
+
+
+@functools.lru_cache(maxsize=256)
+def parse_timing(text):
+    # 回傳 Deadline；無法對應到里程碑 (如【掛號階段】、【拆除後】這類沒有期限的時機) 回傳 None
+    text = text.strip().strip("【】")
+    match = _AFTER.match(text) or _BEFORE.match(text)
+    if not match:
+        return None
+    milestone = _anchor(match["anchor"])
+    if milestone is None:
+        return None
+    months, days = _offset(match["n"], match["unit"], 1 if match.re is _AFTER else -1)
+    return Deadline(milestone, months, days)
+
+
+# --- 2. 到期日 ---
+def parse_date(value):
+    if isinstance(value, date) or value is None:
+        return value
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def milestones_from_state(state):
+    # state：session_state 或資料庫載入的 dict；未填的里程碑不列入
+    result = {}
+    for name in MILESTONES:
+        value = parse_date(state.get(milestone_key(name)))
+        if value is not None:
+            result[name] = value
+    return result
+
+
+def add_months(day, months):
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def due_date(deadline, milestones):
+    anchor = milestones.get(deadline.milestone)
+    if anchor is None:
+        return None
+    return add_months(anchor, deadline.months) + timedelta(days=deadline.days)
+
+
+def schedule(sop_data, milestones):
+    # 回傳 (fingerprint, ((chk_key, stage, 項目名稱, 到期日 ISO), ...))，只含算得出到期日的項目
+    entries = []
+    for stage, items in sop_data.items():
+        for item in items:
+            deadline = parse_timing(item["timing"])
+            due = deadline and due_date(deadline, milestones)
+            if due:
+                entries.append((item["chk_key"], stage, item["item"], due.isoformat()))
+    fingerprint = hashlib.md5("|".join(":".join(e) for e in entries).encode()).hexdigest()
+    return fingerprint, tuple(entries)
+
+
+def permit_expired(milestones, today=None):
+    # 依建照核發日推算 flag_expired；未填建照日時回傳 None (維持手動勾選)
+    permit = milestones.get("permit")
+    if permit is None:
+        return None
+    return (today or date.today()) > add_months(permit, EXPIRY_MONTHS)
+
+
+def index_project(store, project_id, state=None):
+    # 依已存狀態重算單一專案的到期日並寫入 due_index (未變動時 store 直接略過)
+    import sop_engine
+
+    if state is None:
+        sop_engine.ensure_migrated(store, project_id)
+        state = store.load_state(project_id)
+    sop_data = sop_engine.get_sop(sop_engine.params_from_state(state))
+    store.sync_due_dates(project_id, *schedule(sop_data, milestones_from_state(state)))
+
+
+def backfill_due_index(store):
+    missing = store.projects_without_due_index()
+    for project_id in missing:
+        index_project(store, project_id)
+    return len(missing)
+
+
+# --- 3. CLI (每日提醒) ---
+def main(argv=None):
+    import argparse
+    import json
+
+    import sop_store
+
+    parser = argparse.ArgumentParser(description="列出逾期與即將到期的 SOP 項目 (JSON lines)")
+    parser.add_argument("--days", type=int, default=7, help="列出今天起幾天內到期的項目")
+    parser.add_argument("--db", default=sop_store.DEFAULT_DB_PATH)
+    parser.add_argument("--today", type=date.fromisoformat, default=date.today(), help="基準日 (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    store = sop_store.ProjectStore(args.db)
+    backfill_due_index(store)
+    until = (args.today + timedelta(days=args.days)).isoformat()
+    for due, project_id, name, stage, label in store.due_items(until):
+        print(json.dumps({
+            "due_date": due, "overdue": due < args.today.isoformat(),
+            "project_id": project_id, "project": name, "stage": stage, "item": label,
+        }, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
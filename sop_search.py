@@ -0,0 +1,101 @@
+# --- 全文檢索 (反向索引 + CJK n-gram) ---
+# 中文字串切成單字與雙字 (bigram)，英數字串整段小寫 (如 NW2700、B8)，查詢時所有詞元皆須命中，
+# 再以原文比對排除 bigram 拼湊出的誤判。
+#   範本：SOP 項目 (item / dept / docs / details) 與 NW/NS 檢查表，啟動時建一次記憶體索引
+#   備註：note_* 文字的詞元存在 sop_store 的 note_postings，備註變動時只更新該欄位的詞元
+import functools
+import re
+from collections import defaultdict, namedtuple
+
+import sop_engine
+
+SEARCH_FIELDS = ("item", "dept", "docs", "details")
+_CJK = re.compile(r"[㐀-䶿一-鿿豈-﫿]+")
+_WORD = re.compile(r"[0-9a-z]+")
+
+TemplateHit = namedtuple("TemplateHit", ["chk_key", "scope", "title", "field", "text"])
+
+
+# --- 1. 斷詞 ---
+def tokenize(text):
+    text = (text or "").casefold()
+    tokens = set(_WORD.findall(text))
+    for run in _CJK.findall(text):
+        tokens.update(run)
+        tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def query_tokens(text):
+    # 查詢只需雙字 (單字的中文段落才用單字)，命中集合較小
+    text = (text or "").casefold()
+    tokens = set(_WORD.findall(text))
+    for run in _CJK.findall(text):
+        tokens.update([run] if len(run) == 1 else (run[i:i + 2] for i in range(len(run) - 1)))
+    return tokens
+
+
+def matches(text, query):
+    # 以空白分隔的每個詞都要出現在原文 (不分大小寫)
+    text = (text or "").casefold()
+    return all(term in text for term in query.casefold().split())
+
+
+# --- 2. 範本索引 (記憶體) ---
+class TemplateIndex:
+    def __init__(self):
+        self.docs = {}  # chk_key -> (scope, title, {field: text})
+        self.postings = defaultdict(set)  # token -> {chk_key}
+        for chk_key, (stage, item) in sop_engine.all_template_items().items():
+            fields = {field: item[field] for field in SEARCH_FIELDS if item.get(field) and "DYNAMIC" not in item[field]}
+            self._add(chk_key, stage, item["item"], fields)
+        for scope, lst in zip(sop_engine.CHECKLIST_SCOPES, sop_engine.get_checklists()):
+            for code, cat, name, note, _ in lst:
+                fields = {"code": code, "item": name}
+                if note:
+                    fields["note"] = note
+                self._add(sop_engine.checklist_key(code, cat), scope, f"{code} {name}", fields)
+        # note_key -> (scope, 項目名稱)，供備註命中時顯示所屬項目
+        self.note_titles = {
+            "note_" + chk_key[len("chk_"):]: (scope, title) for chk_key, (scope, title, _) in self.docs.items()
+        }
+
+    def _add(self, chk_key, scope, title, fields):
+        self.docs[chk_key] = (scope, title, fields)
+        for text in fields.values():
+            for token in tokenize(text):
+                self.postings[token].add(chk_key)
+        for token in tokenize(title):
+            self.postings[token].add(chk_key)
+
+    def search(self, query):
+        tokens = query_tokens(query)
+        if not tokens:
+            return []
+        candidates = set.intersection(*(self.postings.get(token, set()) for token in tokens))
+        hits = []
+        first_term = query.split()[0]
+        for chk_key in sorted(candidates):
+            scope, title, fields = self.docs[chk_key]
+            if not matches("\n".join((title, *fields.values())), query):
+                continue
+            # 顯示第一個詞出現的欄位
+            field, text = next(
+                ((f, t) for f, t in (("title", title), *fields.items()) if matches(t, first_term)), ("title", title)
+            )
+            hits.append(TemplateHit(chk_key, scope, title, field, text))
+        return hits
+
+
+@functools.lru_cache(maxsize=1)
+def template_index():
+    return TemplateIndex()
+
+
+# --- 3. 查詢 ---
+def search_notes(store, query, limit=200):
+    # 回傳 [(project_id, 專案名稱, note_key, 備註文字), ...]
+    return [
+        row for row in store.search_notes(sorted(query_tokens(query)), limit * 2)
+        if matches(row[3], query)
+    ][:limit]
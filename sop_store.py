@@ -0,0 +1,696 @@
+# --- 專案儲存層 (SQLite) ---
+# 多專案的側邊欄參數與 chk_*/note_*/flag_* 狀態都存在本機 SQLite (WAL 模式)。
+# 每次互動只寫入變動的單一欄位，不做整份快照。
+# note_* 備註同時維護全文檢索的詞元 (note_postings)，只更新變動的那一欄。
+# 所有狀態變動同時附加到事件記錄 (events，seq = 專案版本)，每 SNAPSHOT_INTERVAL 個版本存一份快照；
+# 載入專案 = 最新快照 + 之後的事件，歷史再長載入成本也有上限。project_state 為目前值的投影，供各索引查詢。
+# 多人同時編輯同一專案：每次寫入遞增專案版本並記在該欄位上，
+# 各 session 只拉取自己已知版本之後的變更 (changes_since)，寫入時以版本做樂觀鎖。
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import sop_search
+
+DEFAULT_DB_PATH = os.environ.get(
+    "CMAPP_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cmapp.db")
+)
+
+SNAPSHOT_INTERVAL = 200
+
+# 需要持久化的 session_state key 前綴
+PERSISTED_PREFIXES = ("kp_", "chk_", "note_", "flag_", "ms_")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_projects_updated ON projects (updated_at);
+-- 事件記錄 (只附加)：同一版本可含多個欄位 (如模板遷移)；value 為 NULL 表示刪除該欄位
+CREATE TABLE IF NOT EXISTS events (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    ts REAL NOT NULL,
+    PRIMARY KEY (project_id, seq, key)
+) WITHOUT ROWID;
+-- 快照：seq 版本時的完整狀態 (zlib 壓縮 JSON)
+CREATE TABLE IF NOT EXISTS snapshots (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    state BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (project_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS project_state (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (project_id, key)
+) WITHOUT ROWID;
+
+-- 進度彙總：勾選時以增量更新，儀表板不必重掃各專案狀態
+CREATE TABLE IF NOT EXISTS progress_meta (
+    project_id INTEGER PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    fingerprint TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS progress_items (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    chk_key TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    label TEXT NOT NULL,
+    done INTEGER NOT NULL,
+    PRIMARY KEY (project_id, chk_key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS progress_counters (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    scope TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL,
+    PRIMARY KEY (project_id, scope)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS portfolio_totals (
+    scope TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pending_items (
+    scope TEXT NOT NULL,
+    label TEXT NOT NULL,
+    pending INTEGER NOT NULL,
+    PRIMARY KEY (scope, label)
+) WITHOUT ROWID;
+
+-- 到期日索引 (sop_schedule)：依日期排序，逾期 / 即將到期為範圍查詢
+CREATE TABLE IF NOT EXISTS due_meta (
+    project_id INTEGER PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    fingerprint TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS due_index (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    item_key TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    label TEXT NOT NULL,
+    due_date TEXT NOT NULL,
+    done INTEGER NOT NULL,
+    PRIMARY KEY (project_id, item_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_due_open ON due_index (due_date) WHERE done = 0;
+
+-- 備註全文檢索 (sop_search.tokenize 的詞元)
+CREATE TABLE IF NOT EXISTS note_postings (
+    token TEXT NOT NULL,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    note_key TEXT NOT NULL,
+    PRIMARY KEY (token, project_id, note_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_note_postings_doc ON note_postings (project_id, note_key);
+-- 「哪些專案尚未完成某項目」
+CREATE INDEX IF NOT EXISTS idx_progress_items_key ON progress_items (chk_key, done);
+
+-- 附件：blob 為 sop_blobs 的內容定址檔名，同一內容可被多個專案 / 項目參照
+CREATE TABLE IF NOT EXISTS attachments (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    item_key TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    blob TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_attachments_item ON attachments (project_id, item_key);
+CREATE INDEX IF NOT EXISTS idx_attachments_blob ON attachments (blob);
+"""
+
+
+# 舊資料庫補上的欄位 (table, column, 定義)
+_MIGRATIONS = (
+    ("projects", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("project_state", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("projects", "template_version", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+
+class VersionConflict(Exception):
+    # 寫入的欄位在此 session 已知版本之後已被其他人改成不同的值
+    def __init__(self, key, value, version):
+        super().__init__(f"{key} 已於版本 {version} 被其他使用者修改")
+        self.key = key
+        self.value = value
+        self.version = version
+
+
+class ProjectNotFound(Exception):
+    # 專案已被刪除 (如其他 session 在側邊欄刪除)
+    def __init__(self, project_id):
+        super().__init__(f"專案 {project_id} 不存在")
+        self.project_id = project_id
+
+
+class DuplicateProjectName(Exception):
+    def __init__(self, name):
+        super().__init__(f"專案名稱「{name}」已存在")
+        self.name = name
+
+
+def _encode(value):
+    # 里程碑日期 (date) 以 ISO 字串保存
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, default=_encode)
+
+
+def is_persisted_key(key):
+    return isinstance(key, str) and key.startswith(PERSISTED_PREFIXES)
+
+
+class ProjectStore:
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        # Streamlit 每個 session 在不同執行緒，連線共用並以 lock 序列化
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _migrate(self):
+        with self._transaction() as conn:
+            for table, column, definition in _MIGRATIONS:
+                if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+                # 既有備註建立檢索詞元
+                for project_id, key, value in conn.execute(
+                    "SELECT project_id, key, value FROM project_state WHERE key LIKE 'note!_%' ESCAPE '!'"
+                ).fetchall():
+                    self._index_note(conn, project_id, key, json.loads(value))
+                conn.execute("PRAGMA user_version = 1")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < 2:
+                # 既有專案以目前狀態建立第一份快照，之後的寫入才記成事件
+                for project_id, version in conn.execute("SELECT id, version FROM projects").fetchall():
+                    self._write_snapshot(conn, project_id, version)
+                conn.execute("DROP INDEX IF EXISTS idx_state_version")  # 變更串流改由 events 提供
+                conn.execute("PRAGMA user_version = 2")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- 專案 ---
+    def list_projects(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, name FROM projects ORDER BY updated_at DESC, id DESC"
+            ).fetchall()
+
+    def project_name(self, project_id):
+        with self._lock:
+            row = self._conn.execute("SELECT name FROM projects WHERE id = ?", (project_id,)).fetchone()
+        return row[0] if row else None
+
+    def create_project(self, name, state=None, progress=None, template_version=0):
+        # template_version：state 所依據的模板版本 (sop_engine.TEMPLATE_VERSION)，相同時載入不必遷移
+        now = time.time()
+        with self._transaction() as conn:
+            try:
+                cur = conn.execute(
+                    "INSERT INTO projects (name, created_at, updated_at, template_version) VALUES (?, ?, ?, ?)",
+                    (name, now, now, template_version),
+                )
+            except sqlite3.IntegrityError as exc:
+                raise DuplicateProjectName(name) from exc
+            project_id = cur.lastrowid
+            if state:
+                conn.executemany(
+                    "INSERT INTO project_state (project_id, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                    [(project_id, k, _dumps(v), now) for k, v in state.items()],
+                )
+                for key in state:
+                    if key.startswith("note_"):
+                        self._index_note(conn, project_id, key, state[key])
+            self._write_snapshot(conn, project_id, 0)
+            if progress:
+                self._sync_progress(conn, project_id, *progress)
+        return project_id
+
+    def create_projects(self, entries, template_version=0):
+        # 批次建立 [(name, state, progress), ...]，同一交易內完成；名稱重複者回傳 None
+        # progress 為 (fingerprint, scopes)，見 sync_progress；template_version 同 create_project
+        now = time.time()
+        created = []
+        with self._transaction() as conn:
+            for name, state, progress in entries:
+                cur = conn.execute(
+                    "INSERT INTO projects (name, created_at, updated_at, template_version) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (name) DO NOTHING",
+                    (name, now, now, template_version),
+                )
+                if not cur.rowcount:
+                    created.append(None)
+                    continue
+                project_id = cur.lastrowid
+                conn.executemany(
+                    "INSERT INTO project_state (project_id, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                    [(project_id, k, _dumps(v), now) for k, v in state.items()],
+                )
+                for key in state:
+                    if key.startswith("note_"):
+                        self._index_note(conn, project_id, key, state[key])
+                self._write_snapshot(conn, project_id, 0)
+                if progress:
+                    self._sync_progress(conn, project_id, *progress)
+                created.append(project_id)
+        return created
+
+    def delete_project(self, project_id):
+        # 回傳此專案附件中已不再被任何專案參照的 blob，由呼叫端刪除檔案
+        with self._transaction() as conn:
+            blobs = [row[0] for row in conn.execute(
+                "SELECT DISTINCT blob FROM attachments WHERE project_id = ?", (project_id,)
+            ).fetchall()]
+            self._remove_progress(conn, project_id)
+            conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+            return [
+                blob for blob in blobs
+                if conn.execute("SELECT 1 FROM attachments WHERE blob = ? LIMIT 1", (blob,)).fetchone() is None
+            ]
+
+    # --- 狀態 ---
+    def load_state(self, project_id):
+        # 最新快照 + 之後的事件 (最多 SNAPSHOT_INTERVAL 個版本)
+        with self._lock:
+            snapshot = self._conn.execute(
+                "SELECT seq, state FROM snapshots WHERE project_id = ? ORDER BY seq DESC LIMIT 1", (project_id,)
+            ).fetchone()
+            seq, state = (snapshot[0], json.loads(zlib.decompress(snapshot[1]))) if snapshot else (-1, {})
+            tail = self._conn.execute(
+                "SELECT key, value FROM events WHERE project_id = ? AND seq > ? ORDER BY seq", (project_id, seq)
+            ).fetchall()
+        for key, value in tail:
+            if value is None:
+                state.pop(key, None)
+            else:
+                state[key] = json.loads(value)
+        return state
+
+    def project_version(self, project_id, missing=0):
+        # missing：專案不存在時的回傳值
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM projects WHERE id = ?", (project_id,)).fetchone()
+        return row[0] if row else missing
+
+    def template_version(self, project_id):
+        with self._lock:
+            row = self._conn.execute("SELECT template_version FROM projects WHERE id = ?", (project_id,)).fetchone()
+        return row[0] if row else 0
+
+    def changes_since(self, project_id, version):
+        # 事件記錄即變更串流：回傳 (目前版本, {key: value}, {已刪除的 key})，只含 version 之後的事件
+        with self._lock:
+            current = self.project_version(project_id)
+            rows = self._conn.execute(
+                "SELECT key, value FROM events WHERE project_id = ? AND seq > ? ORDER BY seq", (project_id, version)
+            ).fetchall()
+        changes, deleted = {}, set()
+        for key, value in rows:
+            if value is None:
+                changes.pop(key, None)
+                deleted.add(key)
+            else:
+                deleted.discard(key)
+                changes[key] = json.loads(value)
+        return current, changes, deleted
+
+    def set_value(self, project_id, key, value, expected_version=None, own_version=None):
+        # 單一欄位寫入，遞增專案版本並回傳新版本，同時更新專案的最後修改時間。
+        # expected_version：寫入者最後同步到的版本；該欄位之後已被改成不同的值時拋出 VersionConflict
+        # own_version：寫入者上次寫入此欄位的版本；欄位仍停在該版本代表是自己的寫入，不算衝突
+        now = time.time()
+        encoded = _dumps(value)
+        with self._transaction() as conn:
+            if expected_version is not None:
+                row = conn.execute(
+                    "SELECT value, version FROM project_state WHERE project_id = ? AND key = ?", (project_id, key)
+                ).fetchone()
+                if row and row[1] > expected_version and row[1] != own_version and row[0] != encoded:
+                    raise VersionConflict(key, json.loads(row[0]), row[1])
+            version = self._next_version(conn, project_id, now)
+            self._write(conn, project_id, version, key, encoded, now)
+            self._maybe_snapshot(conn, project_id, version)
+        return version
+
+    def apply_changes(self, project_id, changes, deleted=(), template_version=None, attachment_renames=None):
+        # 多個欄位以同一個版本寫入 (如模板遷移)；deleted 中的欄位移除。寫入後立即存快照
+        # attachment_renames：{舊 item_key: 新 item_key}，附件在同一交易內改掛
+        now = time.time()
+        with self._transaction() as conn:
+            version = self._next_version(conn, project_id, now)
+            for key in deleted:
+                if key not in changes:
+                    self._write(conn, project_id, version, key, None, now)
+            for key, value in changes.items():
+                self._write(conn, project_id, version, key, _dumps(value), now)
+            if template_version is not None:
+                self._set_template_version(conn, project_id, template_version, attachment_renames)
+            self._write_snapshot(conn, project_id, version)
+        return version
+
+    def set_template_version(self, project_id, template_version, attachment_renames=None):
+        # 狀態不需遷移時只記錄模板版本 (不增加專案版本)
+        with self._transaction() as conn:
+            self._set_template_version(conn, project_id, template_version, attachment_renames)
+
+    def _set_template_version(self, conn, project_id, template_version, attachment_renames):
+        conn.execute("UPDATE projects SET template_version = ? WHERE id = ?", (template_version, project_id))
+        if attachment_renames:
+            conn.executemany(
+                "UPDATE attachments SET item_key = ? WHERE project_id = ? AND item_key = ?",
+                [(new, project_id, old) for old, new in attachment_renames.items()],
+            )
+
+    def _next_version(self, conn, project_id, now):
+        row = conn.execute(
+            "UPDATE projects SET updated_at = ?, version = version + 1 WHERE id = ? RETURNING version",
+            (now, project_id),
+        ).fetchone()
+        if row is None:
+            raise ProjectNotFound(project_id)
+        return row[0]
+
+    def _write(self, conn, project_id, version, key, encoded, now):
+        # 事件 + 目前值投影 + 各索引；encoded 為 None 表示刪除
+        conn.execute(
+            "INSERT INTO events (project_id, seq, key, value, ts) VALUES (?, ?, ?, ?, ?)",
+            (project_id, version, key, encoded, now),
+        )
+        if encoded is None:
+            conn.execute("DELETE FROM project_state WHERE project_id = ? AND key = ?", (project_id, key))
+            value = None
+        else:
+            conn.execute(
+                "INSERT INTO project_state (project_id, key, value, updated_at, version) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (project_id, key) DO UPDATE SET "
+                "value = excluded.value, updated_at = excluded.updated_at, version = excluded.version",
+                (project_id, key, encoded, now, version),
+            )
+            value = json.loads(encoded)
+        if key.startswith("chk_"):
+            self._apply_check(conn, project_id, key, bool(value))
+            conn.execute(
+                "UPDATE due_index SET done = ? WHERE project_id = ? AND item_key = ?",
+                (int(bool(value)), project_id, key),
+            )
+        elif key.startswith("note_"):
+            self._index_note(conn, project_id, key, value)
+
+    def _maybe_snapshot(self, conn, project_id, version):
+        last = conn.execute("SELECT MAX(seq) FROM snapshots WHERE project_id = ?", (project_id,)).fetchone()[0]
+        if last is None or version - last >= SNAPSHOT_INTERVAL:
+            self._write_snapshot(conn, project_id, version)
+
+    def _write_snapshot(self, conn, project_id, version):
+        state = {
+            key: json.loads(value) for key, value in conn.execute(
+                "SELECT key, value FROM project_state WHERE project_id = ?", (project_id,)
+            )
+        }
+        conn.execute(
+            "INSERT OR REPLACE INTO snapshots (project_id, seq, state, created_at) VALUES (?, ?, ?, ?)",
+            (project_id, version, zlib.compress(_dumps(state).encode()), time.time()),
+        )
+
+    # --- 全文檢索 ---
+    def _index_note(self, conn, project_id, note_key, text):
+        conn.execute("DELETE FROM note_postings WHERE project_id = ? AND note_key = ?", (project_id, note_key))
+        conn.executemany(
+            "INSERT INTO note_postings (token, project_id, note_key) VALUES (?, ?, ?)",
+            [(token, project_id, note_key) for token in sop_search.tokenize(str(text or ""))],
+        )
+
+    def search_notes(self, tokens, limit=200):
+        # 含有全部詞元的備註：[(project_id, 專案名稱, note_key, 備註文字), ...]
+        if not tokens:
+            return []
+        placeholders = ",".join("?" * len(tokens))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT n.project_id, p.name, n.note_key, s.value FROM ("
+                f"  SELECT project_id, note_key FROM note_postings WHERE token IN ({placeholders})"
+                "  GROUP BY project_id, note_key HAVING COUNT(*) = ? LIMIT ?"
+                ") n JOIN projects p ON p.id = n.project_id"
+                " JOIN project_state s ON s.project_id = n.project_id AND s.key = n.note_key"
+                " ORDER BY p.updated_at DESC",
+                (*tokens, len(tokens), limit),
+            ).fetchall()
+        return [(project_id, name, note_key, json.loads(value)) for project_id, name, note_key, value in rows]
+
+    def projects_lacking(self, chk_key):
+        # 此項目適用但尚未勾選的專案 (走 idx_progress_items_key)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT p.id, p.name FROM progress_items i JOIN projects p ON p.id = i.project_id"
+                " WHERE i.chk_key = ? AND i.done = 0 ORDER BY p.name",
+                (chk_key,),
+            ).fetchall()
+
+    # --- 進度彙總 ---
+    def sync_progress(self, project_id, fingerprint, scopes):
+        # scopes：{scope: ((chk_key, label), ...)}，專案模板改變 (fingerprint 不同) 時才重建
+        with self._transaction() as conn:
+            self._sync_progress(conn, project_id, fingerprint, scopes)
+
+    def _sync_progress(self, conn, project_id, fingerprint, scopes):
+        row = conn.execute("SELECT fingerprint FROM progress_meta WHERE project_id = ?", (project_id,)).fetchone()
+        if row and row[0] == fingerprint:
+            return
+        self._remove_progress(conn, project_id)
+
+        checked = {
+            key for key, value in conn.execute(
+                "SELECT key, value FROM project_state WHERE project_id = ? AND key LIKE 'chk!_%' ESCAPE '!'",
+                (project_id,),
+            )
+            if json.loads(value)
+        }
+        items, counters, pending = [], [], []
+        for scope, entries in scopes.items():
+            done = 0
+            for chk_key, label in entries:
+                is_done = chk_key in checked
+                done += is_done
+                items.append((project_id, chk_key, scope, label, int(is_done)))
+                if not is_done:
+                    pending.append((scope, label))
+            counters.append((project_id, scope, len(entries), done))
+
+        conn.executemany(
+            "INSERT OR REPLACE INTO progress_items (project_id, chk_key, scope, label, done) VALUES (?, ?, ?, ?, ?)",
+            items,
+        )
+        conn.executemany(
+            "INSERT INTO progress_counters (project_id, scope, total, done) VALUES (?, ?, ?, ?)", counters
+        )
+        conn.executemany(
+            "INSERT INTO portfolio_totals (scope, total, done) VALUES (?, ?, ?) "
+            "ON CONFLICT (scope) DO UPDATE SET total = total + excluded.total, done = done + excluded.done",
+            [(scope, total, done) for _, scope, total, done in counters],
+        )
+        conn.executemany(
+            "INSERT INTO pending_items (scope, label, pending) VALUES (?, ?, 1) "
+            "ON CONFLICT (scope, label) DO UPDATE SET pending = pending + 1",
+            pending,
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO progress_meta (project_id, fingerprint) VALUES (?, ?)", (project_id, fingerprint)
+        )
+
+    def _remove_progress(self, conn, project_id):
+        # 從全體彙總扣除此專案的貢獻
+        conn.executemany(
+            "UPDATE portfolio_totals SET total = total - ?, done = done - ? WHERE scope = ?",
+            conn.execute(
+                "SELECT total, done, scope FROM progress_counters WHERE project_id = ?", (project_id,)
+            ).fetchall(),
+        )
+        conn.executemany(
+            "UPDATE pending_items SET pending = pending - 1 WHERE scope = ? AND label = ?",
+            conn.execute(
+                "SELECT scope, label FROM progress_items WHERE project_id = ? AND done = 0", (project_id,)
+            ).fetchall(),
+        )
+        for table in ("progress_items", "progress_counters", "progress_meta"):
+            conn.execute(f"DELETE FROM {table} WHERE project_id = ?", (project_id,))
+
+    def _apply_check(self, conn, project_id, chk_key, done):
+        # 單一勾選變動：O(1) 更新專案計數、全體彙總與未完成項目計數
+        row = conn.execute(
+            "SELECT scope, label, done FROM progress_items WHERE project_id = ? AND chk_key = ?",
+            (project_id, chk_key),
+        ).fetchone()
+        if row is None or bool(row[2]) == done:
+            return
+        scope, label, _ = row
+        delta = 1 if done else -1
+        conn.execute(
+            "UPDATE progress_items SET done = ? WHERE project_id = ? AND chk_key = ?", (int(done), project_id, chk_key)
+        )
+        conn.execute(
+            "UPDATE progress_counters SET done = done + ? WHERE project_id = ? AND scope = ?", (delta, project_id, scope)
+        )
+        conn.execute("UPDATE portfolio_totals SET done = done + ? WHERE scope = ?", (delta, scope))
+        conn.execute(
+            "UPDATE pending_items SET pending = pending - ? WHERE scope = ? AND label = ?", (delta, scope, label)
+        )
+
+    # --- 到期日索引 ---
+    def sync_due_dates(self, project_id, fingerprint, entries):
+        # entries：((chk_key, stage, label, 到期日 ISO), ...)，里程碑或模板改變 (fingerprint 不同) 時才重建
+        with self._transaction() as conn:
+            row = conn.execute("SELECT fingerprint FROM due_meta WHERE project_id = ?", (project_id,)).fetchone()
+            if row and row[0] == fingerprint:
+                return
+            checked = {
+                key for key, value in conn.execute(
+                    "SELECT key, value FROM project_state WHERE project_id = ? AND key LIKE 'chk!_%' ESCAPE '!'",
+                    (project_id,),
+                )
+                if json.loads(value)
+            }
+            conn.execute("DELETE FROM due_index WHERE project_id = ?", (project_id,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO due_index (project_id, item_key, stage, label, due_date, done) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(project_id, key, stage, label, due, int(key in checked)) for key, stage, label, due in entries],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO due_meta (project_id, fingerprint) VALUES (?, ?)", (project_id, fingerprint)
+            )
+
+    def projects_without_due_index(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT id FROM projects WHERE id NOT IN (SELECT project_id FROM due_meta)"
+            )]
+
+    def due_items(self, until, since=None, limit=None):
+        # 未完成且到期日 < until (ISO) 的項目，依到期日排序；since 為下限 (含)，省略時包含所有逾期項目
+        with self._lock:
+            return self._conn.execute(
+                "SELECT d.due_date, d.project_id, p.name, d.stage, d.label"
+                " FROM due_index d JOIN projects p ON p.id = d.project_id"
+                " WHERE d.done = 0 AND d.due_date >= ? AND d.due_date < ?"
+                " ORDER BY d.due_date, d.project_id LIMIT ?",
+                (since or "", until, -1 if limit is None else limit),
+            ).fetchall()
+
+    # --- 附件 ---
+    def add_attachment(self, project_id, item_key, filename, blob, size):
+        with self._transaction() as conn:
+            try:
+                return conn.execute(
+                    "INSERT INTO attachments (project_id, item_key, filename, blob, size, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (project_id, item_key, filename, blob, size, time.time()),
+                ).lastrowid
+            except sqlite3.IntegrityError as exc:
+                raise ProjectNotFound(project_id) from exc
+
+    def project_attachments(self, project_id):
+        # 整個專案一次查詢：{item_key: [(id, filename, blob, size), ...]}
+        result = {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT item_key, id, filename, blob, size FROM attachments WHERE project_id = ? ORDER BY id",
+                (project_id,),
+            ).fetchall()
+        for item_key, *attachment in rows:
+            result.setdefault(item_key, []).append(tuple(attachment))
+        return result
+
+    def delete_attachment(self, attachment_id):
+        # 回傳 (blob, 是否仍被其他附件參照)；不再被參照時由呼叫端刪除檔案
+        with self._transaction() as conn:
+            row = conn.execute("SELECT blob FROM attachments WHERE id = ?", (attachment_id,)).fetchone()
+            if row is None:
+                return None, True
+            conn.execute("DELETE FROM attachments WHERE id = ?", (attachment_id,))
+            still_used = conn.execute("SELECT 1 FROM attachments WHERE blob = ? LIMIT 1", row).fetchone()
+        return row[0], still_used is not None
+
+    def attachment_blobs(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT blob FROM attachments")]
+
+    def projects_without_progress(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT id FROM projects WHERE id NOT IN (SELECT project_id FROM progress_meta)"
+            )]
+
+    def portfolio_totals(self):
+        with self._lock:
+            return self._conn.execute("SELECT scope, total, done FROM portfolio_totals").fetchall()
+
+    def pending_items(self, scopes, limit=10):
+        # 各 scope 未完成專案數最多的項目
+        placeholders = ",".join("?" * len(scopes))
+        with self._lock:
+            return self._conn.execute(
+                "SELECT scope, label, pending FROM ("
+                "  SELECT scope, label, pending,"
+                "         ROW_NUMBER() OVER (PARTITION BY scope ORDER BY pending DESC) AS rn"
+                f"  FROM pending_items WHERE pending > 0 AND scope IN ({placeholders})"
+                ") WHERE rn <= ? ORDER BY scope, pending DESC",
+                (*scopes, limit),
+            ).fetchall()
+
+    def completion_histogram(self, bins=10):
+        # 各專案整體完成率分桶計數 (儀表板用，不逐專案回傳)
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MIN(CAST(ratio * ? AS INTEGER), ? - 1) AS bucket, COUNT(*) FROM ("
+                "  SELECT CAST(SUM(done) AS REAL) / MAX(SUM(total), 1) AS ratio"
+                "  FROM progress_counters GROUP BY project_id"
+                ") GROUP BY bucket ORDER BY bucket",
+                (bins, bins),
+            ).fetchall()
+
+    def stage_reached(self, stage_scopes):
+        # 各專案目前停在哪一階段 (第一個未完成的階段)；全部完成記為 len(stage_scopes)
+        order = {scope: i for i, scope in enumerate(stage_scopes)}
+        placeholders = ",".join("?" * len(stage_scopes))
+        case = " ".join(f"WHEN '{scope}' THEN {i}" for scope, i in order.items())
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT reached, COUNT(*) FROM ("
+                f"  SELECT project_id, COALESCE(MIN(CASE WHEN done < total THEN CASE scope {case} END END), ?) AS reached"
+                f"  FROM progress_counters WHERE scope IN ({placeholders}) GROUP BY project_id"
+                f") GROUP BY reached ORDER BY reached",
+                (len(stage_scopes), *stage_scopes),
+            ).fetchall()
@@ -0,0 +1,21 @@
+import pandas as pd
+import pytest
+
+import sop_batch
+
+
+def test_text_flags_use_yes_no_vocabulary():
+    rules = sop_batch.evaluate_rules_frame(pd.DataFrame({"is_slope_land": ["否", "是", None]}))
+    assert rules["is_struct_review_needed"].tolist() == [False, True, False]
+
+
+def test_numbers_accept_thousands_separators():
+    rules = sop_batch.evaluate_rules_frame(pd.DataFrame({"base_area": ["1,200", ""], "duration_month": [8, 8]}))
+    assert rules["is_b8_needed"].tolist() == [True, False]
+    assert rules["is_water_plan_needed"].tolist() == [True, False]
+
+
+@pytest.mark.parametrize("column, value", [("base_area", "abc"), ("is_slope_land", "maybe")])
+def test_unparseable_values_raise(column, value):
+    with pytest.raises(ValueError):
+        sop_batch.normalize_params(pd.DataFrame({column: [value]}))
@@ -0,0 +1,46 @@
+import pytest
+
+import sop_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = sop_store.ProjectStore(str(tmp_path / "test.db"))
+    yield store
+    store.close()
+
+
+def test_own_write_is_not_a_conflict_after_interleaved_write(store):
+    # A 與 B 同步到同一版本；B 先寫，A 的寫入版本不連續，已同步版本停在原處
+    project_id = store.create_project("p")
+    synced = store.project_version(project_id)
+    store.set_value(project_id, "chk_X", True, expected_version=synced)  # B
+    a_own = store.set_value(project_id, "chk_Y", True, expected_version=synced)  # A
+
+    # A 再次修改同一欄位：該列是 A 自己寫的版本，不是他人的修改
+    store.set_value(project_id, "chk_Y", False, expected_version=synced, own_version=a_own)
+    assert store.load_state(project_id) == {"chk_X": True, "chk_Y": False}
+
+    with pytest.raises(sop_store.VersionConflict):
+        store.set_value(project_id, "chk_Y", True, expected_version=synced)  # 未提供 own_version 時視為衝突
+
+
+def test_other_writer_still_conflicts(store):
+    project_id = store.create_project("p")
+    a_own = store.set_value(project_id, "note_a", "A", expected_version=0)
+    store.set_value(project_id, "note_a", "B", expected_version=a_own)
+
+    with pytest.raises(sop_store.VersionConflict) as excinfo:
+        store.set_value(project_id, "note_a", "A2", expected_version=a_own, own_version=a_own)
+    assert excinfo.value.value == "B"
+
+
+def test_write_to_deleted_project_raises_project_not_found(store):
+    project_id = store.create_project("p")
+    store.delete_project(project_id)
+
+    assert store.project_version(project_id, missing=None) is None
+    with pytest.raises(sop_store.ProjectNotFound):
+        store.set_value(project_id, "chk_a", True, expected_version=0)
+    with pytest.raises(sop_store.ProjectNotFound):
+        store.add_attachment(project_id, "chk_a", "a.pdf", "blob", 1)